@@ -0,0 +1,26 @@
+# gunicorn settings, read automatically when gunicorn is started from this directory:
+#   gunicorn scottish_water_dash_deploy:server
+import os
+import subprocess
+import sys
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+# Building the metadata downloads the csv; don't hold up the deployment forever if that stalls
+METADATA_BUILD_TIMEOUT = 300
+
+
+def on_starting(server):
+    """Build the layout metadata cache once in the master, before any worker boots, if it is missing
+
+    Workers then build the layout from the cached file instead of each downloading the csv on their
+    first page load. It runs in a subprocess so the master does not keep pandas and the data in
+    memory. If it fails, workers fall back to building the metadata when they first load the data.
+    """
+    try:
+        subprocess.run([sys.executable, os.path.join(APP_DIR, "scottish_water_dash_deploy.py"),
+                        "--write-metadata", "--if-missing"],
+                       cwd=APP_DIR,
+                       timeout=METADATA_BUILD_TIMEOUT,
+                       check=True)
+    except (OSError, subprocess.SubprocessError) as e:
+        server.log.warning(f"Could not build the layout metadata cache: {e}")
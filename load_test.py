@@ -0,0 +1,427 @@
+# Load test the dashboard: simulate concurrent analysts against a local gunicorn deployment.
+#
+# Each virtual user replays what the browser does: a page load (the /_dash-layout request, then
+# every callback fired with the layout's initial values), then interactions that change one filter and fire the callbacks that
+# depend on it, with a random think time between interactions. Callback ids and filter values are
+# read from the running app's /_dash-dependencies and /_dash-layout routes. Until the first timed
+# page load, the harness only requests /_dash-dependencies, which never loads the data, so cold runs
+# stay cold. Dropdown options
+# returned by callbacks (e.g. the months of the selected season) replace the layout's options for
+# the rest of the session, and a value that is no longer offered is re-picked from them.
+#
+# Example:
+#   python load_test.py --workers 2 4 --concurrency 5 20 --think-time 1 5 --modes cold warm
+#
+# Per-worker memory is read from /proc, so it is only reported on Linux for servers started here.
+import argparse
+import json
+import os
+import random
+import socket
+import statistics
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+
+APP_MODULE = "scottish_water_dash_deploy:server"
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Browsers open at most 6 connections per host, so a page's callbacks run 6 at a time
+BROWSER_CONNECTIONS = 6
+# Numeric inputs without options are given a random value from this range
+NUMBER_INPUT_RANGE = (1, 10)
+SERVER_START_TIMEOUT = 120
+REQUEST_TIMEOUT = 120
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def get_json(url, timeout=REQUEST_TIMEOUT):
+    with urllib.request.urlopen(url, timeout=timeout) as response:
+        return json.load(response)
+
+
+def start_server(workers, threads, port, extra_args):
+    """Start gunicorn serving the app and wait until it answers; returns the Popen object"""
+    command = [sys.executable, "-m", "gunicorn",
+               "--workers", str(workers),
+               "--threads", str(threads),
+               "--bind", f"127.0.0.1:{port}",
+               "--timeout", str(REQUEST_TIMEOUT),
+               *extra_args,
+               APP_MODULE]
+    process = subprocess.Popen(command, cwd=REPO_DIR, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    deadline = time.time() + SERVER_START_TIMEOUT
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"gunicorn exited with code {process.returncode}")
+        try:
+            # Unlike /_dash-layout, this never loads the data, so it doesn't warm a worker
+            get_json(f"http://127.0.0.1:{port}/_dash-dependencies", timeout=5)
+            return process
+        except (urllib.error.URLError, ConnectionError, OSError):
+            time.sleep(0.25)
+    stop_server(process)
+    raise RuntimeError(f"gunicorn did not answer within {SERVER_START_TIMEOUT}s")
+
+
+def stop_server(process):
+    process.terminate()
+    try:
+        process.wait(timeout=30)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+
+
+def worker_pids(master_pid):
+    """Pids of the gunicorn workers (children of the master process)"""
+    pids = []
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                # The ppid is the 2nd field after the parenthesised process name
+                ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        if ppid == master_pid:
+            pids.append(int(entry))
+    return pids
+
+
+def rss_mb(pid):
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+class MemorySampler(threading.Thread):
+    """Record the peak resident memory of each gunicorn worker while a run is in progress"""
+
+    def __init__(self, master_pid, interval=0.5):
+        super().__init__(daemon=True)
+        self.master_pid = master_pid
+        self.interval = interval
+        self.peaks = {}
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.is_set():
+            self.sample()
+            self.stopped.wait(self.interval)
+        self.sample()
+
+    def sample(self):
+        for pid in worker_pids(self.master_pid):
+            rss = rss_mb(pid)
+            if rss is not None:
+                self.peaks[pid] = max(rss, self.peaks.get(pid, 0))
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+
+
+def find_components(node, components):
+    """Collect the props of every component with an id in a /_dash-layout tree"""
+    if isinstance(node, list):
+        for child in node:
+            find_components(child, components)
+    elif isinstance(node, dict):
+        props = node.get("props", {})
+        if "id" in props:
+            components[props["id"]] = props
+        find_components(props.get("children"), components)
+    return components
+
+
+def option_values(options):
+    return [o["value"] if isinstance(o, dict) else o for o in options]
+
+
+def updated_options(responses):
+    """Dropdown option values set by callback responses, by component id"""
+    options = {}
+    for response in responses:
+        for component_id, props in (response or {}).get("response", {}).items():
+            if "options" in props:
+                options[component_id] = option_values(props["options"])
+    return options
+
+
+def split_outputs(output):
+    """Turn a callback id into the renderer's outputs field (a dict, or a list for multi-output)"""
+    def to_dict(output_id):
+        component_id, prop = output_id.rsplit(".", 1)
+        return {"id": component_id, "property": prop}
+
+    if output.startswith(".."):
+        return [to_dict(o) for o in output[2:-2].split("...")]
+    return to_dict(output)
+
+
+class DashApp:
+    """Callback definitions and filter values of the app under test"""
+
+    def __init__(self, base_url):
+        self.base_url = base_url
+        self.dependencies = [dep for dep in get_json(f"{base_url}/_dash-dependencies")
+                             if not dep.get("clientside_function")]
+        # Filled by the first load_layout(), which is part of the timed run
+        self.components = {}
+
+    def load_layout(self, results):
+        """Request the layout like a page load does, timing it with the callbacks"""
+        started = time.perf_counter()
+        try:
+            layout = get_json(f"{self.base_url}/_dash-layout")
+        except (urllib.error.URLError, ConnectionError, OSError, ValueError):
+            results.add(time.perf_counter() - started, False)
+            return False
+        results.add(time.perf_counter() - started, True)
+        self.components = find_components(layout, {})
+        return True
+
+    def initial_state(self):
+        state = {}
+        for dep in self.dependencies:
+            for i in dep["inputs"]:
+                state[(i["id"], i["property"])] = self.components.get(i["id"], {}).get(i["property"])
+        return state
+
+    def choices(self, component_id, prop, session_options=None):
+        """Values a user could pick for an input, or None if it cannot be varied
+
+        session_options maps component ids to the option values last returned by a callback.
+        """
+        props = self.components.get(component_id, {})
+        if prop == "value" and session_options and session_options.get(component_id):
+            return session_options[component_id]
+        if prop == "value" and "options" in props:
+            return option_values(props["options"])
+        if prop == "value" and props.get("type") == "number":
+            return list(range(NUMBER_INPUT_RANGE[0], NUMBER_INPUT_RANGE[1] + 1))
+        if prop == "end_date":
+            start = date.fromisoformat(str(props.get("min_date_allowed", "2019-01-01"))[:10])
+            # Mostly keep the default (no end date), otherwise pick a range of up to a year
+            return [None, None, None] + [(start + timedelta(days=d)).isoformat() for d in range(30, 366, 30)]
+        return None
+
+    def dependents(self, changed):
+        return [dep for dep in self.dependencies
+                if any((i["id"], i["property"]) == changed for i in dep["inputs"])]
+
+    def variable_inputs(self):
+        inputs = {(i["id"], i["property"]) for dep in self.dependencies for i in dep["inputs"]}
+        return sorted(key for key in inputs if self.choices(*key))
+
+    def payload(self, dep, state, changed):
+        return {"output": dep["output"],
+                "outputs": split_outputs(dep["output"]),
+                "inputs": [{**i, "value": state.get((i["id"], i["property"]))} for i in dep["inputs"]],
+                "changedPropIds": [f"{component_id}.{prop}" for component_id, prop in changed],
+                "state": [{**s, "value": state.get((s["id"], s["property"]))} for s in dep.get("state", [])]}
+
+
+class Results:
+    def __init__(self):
+        self.latencies = []
+        self.errors = 0
+        self.lock = threading.Lock()
+
+    def add(self, latency, ok):
+        with self.lock:
+            if ok:
+                self.latencies.append(latency)
+            else:
+                self.errors += 1
+
+
+def post_callback(base_url, payload, results):
+    request = urllib.request.Request(f"{base_url}/_dash-update-component",
+                                     data=json.dumps(payload).encode(),
+                                     headers={"Content-Type": "application/json"})
+    started = time.perf_counter()
+    body = None
+    content = b""
+    try:
+        with urllib.request.urlopen(request, timeout=REQUEST_TIMEOUT) as response:
+            content = response.read()
+            ok = response.status in (200, 204)
+    except (urllib.error.URLError, ConnectionError, OSError):
+        ok = False
+    results.add(time.perf_counter() - started, ok)
+
+    if ok and content:
+        try:
+            body = json.loads(content)
+        except ValueError:
+            pass
+    return body
+
+
+def fire(dash_app, connections, deps, state, changed, results, session_options, rng):
+    """Fire callbacks in parallel like the browser does and wait for all of them
+
+    When a callback replaces a dropdown's options and the selected value is no longer offered, the
+    browser clears it; the user then picks one of the new options, which fires its dependents too.
+    """
+    futures = [connections.submit(post_callback, dash_app.base_url, dash_app.payload(dep, state, changed), results)
+               for dep in deps]
+    responses = [future.result() for future in futures]
+
+    for component_id, values in updated_options(responses).items():
+        session_options[component_id] = values
+        selected = (component_id, "value")
+        if selected in state and state[selected] not in values and values:
+            state[selected] = rng.choice(values)
+            fire(dash_app, connections, dash_app.dependents(selected), state, [selected], results,
+                 session_options, rng)
+
+
+def virtual_user(dash_app, seed, think_time, interactions, end_time, results):
+    """Repeat browsing sessions (page load then interactions) until end_time"""
+    rng = random.Random(seed)
+    with ThreadPoolExecutor(max_workers=BROWSER_CONNECTIONS) as connections:
+        while time.time() < end_time:
+            if not dash_app.load_layout(results):
+                # Back off instead of hammering a server that is failing
+                time.sleep(1)
+                continue
+            variable_inputs = dash_app.variable_inputs()
+            state = dash_app.initial_state()
+            session_options = {}
+            fire(dash_app, connections, dash_app.dependencies, state, [], results, session_options, rng)
+
+            for _ in range(interactions):
+                # Exponential think times give the bursty arrivals of real users
+                time.sleep(rng.expovariate(1 / think_time) if think_time > 0 else 0)
+                if time.time() >= end_time:
+                    return
+                changed = rng.choice(variable_inputs)
+                state[changed] = rng.choice(dash_app.choices(*changed, session_options))
+                fire(dash_app, connections, dash_app.dependents(changed), state, [changed], results,
+                     session_options, rng)
+
+
+def warm_up(base_url, workers):
+    """Load the data in every worker (best effort: gunicorn picks the worker for each request)"""
+    with ThreadPoolExecutor(max_workers=workers * 2) as pool:
+        list(pool.map(lambda _: get_json(f"{base_url}/ready"), range(workers * 2)))
+
+
+def percentile(values, pct):
+    if not values:
+        return float("nan")
+    if len(values) == 1:
+        return values[0]
+    return statistics.quantiles(values, n=100, method="inclusive")[pct - 1]
+
+
+def run_config(args, workers, mode, concurrency, think_time, seed):
+    port = free_port()
+    process = start_server(workers, args.threads, port, args.gunicorn_args)
+    base_url = f"http://127.0.0.1:{port}"
+    sampler = MemorySampler(process.pid)
+    try:
+        dash_app = DashApp(base_url)
+        if mode == "warm":
+            warm_up(base_url, workers)
+
+        results = Results()
+        sampler.start()
+        started = time.time()
+        end_time = started + args.duration
+        users = [threading.Thread(target=virtual_user,
+                                  args=(dash_app, seed + n, think_time, args.interactions, end_time, results))
+                 for n in range(concurrency)]
+        for user in users:
+            user.start()
+        for user in users:
+            user.join()
+        elapsed = time.time() - started
+    finally:
+        if sampler.is_alive():
+            sampler.stop()
+        stop_server(process)
+
+    latencies_ms = [latency * 1000 for latency in results.latencies]
+    peaks = list(sampler.peaks.values())
+    return {"workers": workers,
+            "mode": mode,
+            "users": concurrency,
+            "think_time_s": think_time,
+            "requests": len(latencies_ms),
+            "errors": results.errors,
+            "throughput_rps": round(len(latencies_ms) / elapsed, 2),
+            "p50_ms": round(percentile(latencies_ms, 50), 1),
+            "p95_ms": round(percentile(latencies_ms, 95), 1),
+            "p99_ms": round(percentile(latencies_ms, 99), 1),
+            "worker_rss_mean_mb": round(statistics.mean(peaks), 1) if peaks else None,
+            "worker_rss_max_mb": round(max(peaks), 1) if peaks else None}
+
+
+def print_table(rows):
+    columns = list(rows[0].keys())
+    widths = [max(len(c), *(len(str(row[c])) for row in rows)) for c in columns]
+    print("  ".join(c.rjust(w) for c, w in zip(columns, widths)))
+    for row in rows:
+        print("  ".join(str(row[c]).rjust(w) for c, w in zip(columns, widths)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the dashboard with simulated concurrent users")
+    parser.add_argument("--workers", type=int, nargs="+", default=[2],
+                        help="gunicorn worker counts to test")
+    parser.add_argument("--threads", type=int, default=1,
+                        help="gunicorn threads per worker")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 5, 20],
+                        help="numbers of concurrent virtual users")
+    parser.add_argument("--think-time", type=float, nargs="+", default=[2.0],
+                        help="mean seconds between a user's interactions")
+    parser.add_argument("--modes", nargs="+", choices=["cold", "warm"], default=["cold", "warm"],
+                        help="cold: data loaded by the first requests; warm: /ready called first")
+    parser.add_argument("--duration", type=float, default=60,
+                        help="seconds each configuration runs for")
+    parser.add_argument("--interactions", type=int, default=10,
+                        help="filter changes per session before the user reloads the page")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="also write the results to this json file")
+    parser.add_argument("--gunicorn-args", nargs=argparse.REMAINDER, default=[],
+                        help="extra arguments passed to gunicorn (must be last)")
+    args = parser.parse_args()
+
+    rows = []
+    for workers in args.workers:
+        for mode in args.modes:
+            for concurrency in args.concurrency:
+                for think_time in args.think_time:
+                    row = run_config(args, workers, mode, concurrency, think_time, args.seed)
+                    print(json.dumps(row), file=sys.stderr)
+                    rows.append(row)
+
+    print_table(rows)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(rows, f, indent=1)
+
+
+if __name__ == "__main__":
+    main()
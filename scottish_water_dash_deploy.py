@@ -1,757 +1,1540 @@
-# Import packages
-import pandas as pd
-import numpy as np
-from dash import Dash, html, dcc, callback
-from dash.dependencies import Input, Output
-import plotly_express as px
-import dash_bootstrap_components as dbc
-from datetime import date
-import math
-import gunicorn
-
-# Read in csv as a pandas dataframe
-#https://raw.githubusercontent.com/twrighta/scottish-water-sewage-dashapp/refs/heads/main/no_missing_scottish_sewage_spills.csv
-df_path = 'https://raw.githubusercontent.com/twrighta/scottish-water-sewage-dashapp/main/no_missing_scottish_sewage_spills.csv'
-df = pd.read_csv(df_path)
-
-# Create lists of unique categories for dashboard filtering
-ALL_ASSETS = list(np.unique(df["Asset Name"]))
-ALL_YEARS = list(np.unique(df["Year"]))
-ALL_SEASONS = list(np.unique(df["Season"]))
-ALL_SOURCE_TYPES = list(np.unique(df["Source Type"]))
-ALL_AREAS = list(np.unique(df["Area"]))
-ALL_MONTHS = list(np.unique(df["Month"]))
-
-# Append 'All...' to Years, Seasons, Areas, Months
-ALL_YEARS.append("All")
-ALL_MONTHS.append("All")
-ALL_AREAS.append("All")
-ALL_SEASONS.append("All")
-
-SEASON_MONTH_DICT = {"Winter": ["November", "December", "January"],
-                     "Spring": ["February", "March", "April"],
-                     "Summer": ["May", "June", "July"],
-                     "Autumn": ["August", "September", "October"]}
-
-# Whole dataset metrics for metric text colour formatting
-df_no_0 = df[
-    (df["Duration Mins"] > 0) &
-    (df["Volume Discharged"] > 0)
-    ].copy()
-
-AVG_DURATION_MINS = np.nanmean(df_no_0["Duration Mins"])
-AVG_DISCHARGE = np.nanmean(df_no_0["Volume Discharged"])
-
-# Other Global Formatting Variables
-MARGIN_DICT = {"l": 10,
-               "r": 10,
-               "t": 30,
-               "b": 10}
-PLOT_STYLE = {"height": "90vh",
-              "width": "90vh"}
-
-# Instantiate Dashapp
-app = Dash(__name__,
-           suppress_callback_exceptions=True,
-           external_stylesheets=[dbc.themes.FLATLY])
-server = app.server
-
-# Create the sidebar:
-sidebar = html.Div([
-    #  Options Header Section
-    dbc.Row([
-        html.H2("Filters and Options",
-                style={"margin-top": "10px",
-                       "margin-left": "10px",
-                       "margin-right": "10px",
-                       "border-radius": "10px",
-                       "width": "95%"},
-                className="bg-primary text-white font-italic")
-    ],
-        style={"height": "5vh",
-               "fontWeight": "bold"}),
-
-    # Filtering Dropdown Options Section
-    dbc.Row([
-        dbc.Col([
-            html.P("Year",
-                   style={"padding": "5px",
-                          "font-weight": "bold"}),
-            dcc.Dropdown(options=ALL_YEARS,
-                         value=ALL_YEARS[0],
-                         id="year-dropdown",
-                         placeholder="Select Year",
-                         style={"border-radius": "10px"}),
-            html.P("Area",
-                   style={"padding": "5px",
-                          "font-weight": "bold"}),
-            dcc.Dropdown(options=ALL_AREAS,
-                         value=ALL_AREAS[0],
-                         id="area-dropdown",
-                         placeholder="Select Area",
-                         style={"border-radius": "10px"})
-        ]),
-        dbc.Col([
-            html.P("Season",
-                   style={"padding": "5px",
-                          "font-weight": "bold"}),
-            dcc.Dropdown(
-                options=[{"label": html.Span(["Winter"], style={"color": "blue"}),
-                          "value": "Winter"},
-                         {"label": html.Span(["Spring"], style={"color": "green"}),
-                          "value": "Spring"},
-                         {"label": html.Span(["Summer"], style={"color": "orange"}),
-                          "value": "Summer"},
-                         {"label": html.Span(["Autumn"], style={"color": "purple"}),
-                          "value": "Autumn"},
-                         {"label": html.Span(["All"], style={"color": "black"}),
-                          "value": "All"}
-                         ],
-                value=ALL_SEASONS[0],
-                id="season-dropdown",
-                placeholder="Select Season",
-                style={"border-radius": "10px"}),
-            html.P("Month",
-                   style={"padding": "5px",
-                          "font-weight": "bold"}),
-            dcc.Dropdown(options=ALL_MONTHS,
-                         value=ALL_MONTHS[1],
-                         id="month-dropdown",
-                         placeholder="Select Month(s)",
-                         style={"border-radius": "10px"})
-        ])
-    ],
-        style={"height": "20vh"}),
-
-    # DatePickerRange
-    dbc.Row([
-        dcc.DatePickerRange(
-            start_date=date(2019, 1, 1),
-            end_date=None,
-            end_date_placeholder_text="End date",
-            id="sidebar-date-picker-range",
-            style={"width": "400"},
-            clearable=True,
-            minimum_nights=1,
-            min_date_allowed=date(2019, 1, 1)
-        )
-    ],
-        style={"height": "5vh",
-               "justify-content": "space-around",
-               "flex": "1",
-               "border-radius": "10px"}),
-
-    # Metrics Section
-    dbc.Row([
-        dbc.Col([
-            html.H4("Number of Spills"),
-            html.H5(id="sidebar-number-spills",
-                    style={"font-weight": "bold"})
-        ]),
-        dbc.Col([
-            html.H4("Average Duration (Mins)"),
-            html.H5(id="sidebar-average-duration-mins",
-                    style={"font-weight": "bold"})
-        ]),
-        dbc.Col([
-            html.H4("Average Discharge (m3)"),
-            html.H5(id="sidebar-average-discharge",
-                    style={"font-weight": "bold"})
-        ]),
-        html.Hr()],
-        style={"height": "30vh"}),
-
-    # Pie chart of Volume Discharged by Source Type
-    dbc.Row([
-        dcc.Graph(id="sidebar-vol-pie",
-                  style={"height": "30vh"})
-    ],
-        style={"height": "37.5vh"}),
-
-    # Tom Credits
-    dbc.Row([
-        html.H4("by Tom Wright-Anderson",
-                className="bg-primary text-white font-italic",
-                style={"border-radius": "10px",
-                       "width": "95%"})
-    ],
-        style={"fontWeight": "bold",
-               "height": "2.5vh"})
-
-])
-
-# Content Section:
-# Top Left: Plot of the Point Locations. Coloured by Source Type, Sized by Volume Discharged
-# Top Right: Line/bar chart of Discharge (y) and Time (coloured by Source Type)
-# Bottom Left: Asset stacked bar plot viewer. Select Number and Best/Worst filter.
-# Bottom Right: 2 Plots: Horizontal Box Plots of Duration and Volume Discharged coloured by Source Type
-
-content = html.Div([
-    dbc.Row([
-        dbc.Col([
-            dcc.Graph(id="content-map-fig",
-                      style={"height": "45vh",
-                             "margins": MARGIN_DICT})
-        ],
-            width=6),
-        dbc.Col([
-            html.Div([
-                dcc.Dropdown(options=["Overflow Event Start Time",
-                                      "Start Minute",
-                                      "Start Hour",
-                                      "Week day"],
-                             value="Overflow Event Start Time",
-                             placeholder="Please select a timeframe",
-                             id="timeframe-dropdown",
-                             style={"border-radius": "10px",
-                                    "width": "70%",
-                                    "padding": "2px",
-                                    "justify-content": "space-around"}),
-                dcc.Graph(id="content-discharge-time-fig",
-                          style={"height": "45vh"})
-            ])
-        ],
-            width=6)
-    ],
-        style={"height": "50vh"}),
-
-    # Lower Plots
-    dbc.Row([
-        dbc.Col([
-            html.Div([
-                dcc.RadioItems(id="discharge-duration-radio",
-                               options=["Duration Mins", "Volume Discharged"],
-                               value="Duration Mins",
-                               inline=True,
-                               labelStyle={"display": "inline-block",
-                                           "padding": "10px"}
-                               ),
-                dcc.RadioItems(id="best-worst-radio",
-                               options=["Best", "Worst"],
-                               value="Worst",
-                               inline=True,
-                               labelStyle={"display": "inline-block",
-                                           "padding": "10px"}
-                               ),
-                dcc.Input(id="assets-shown-input",
-                          type="number",
-                          value=3,
-                          placeholder="Number of Assets",
-                          step=1,
-                          min=0,
-                          style={"border-radius": "10px",
-                                 "text-align": "center"})
-            ]),
-            html.Div([
-                dcc.Graph(id="content-asset-performance-fig",
-                          style={"height": "40vh",
-                                 "margins": MARGIN_DICT})
-            ])
-        ],
-            width=6),
-        # Box Plots:
-        dbc.Col([
-            dbc.Col([
-                html.Div([
-                    dcc.RadioItems(options=["Duration Mins", "Volume Discharged"],
-                                   value="Duration Mins",
-                                   id="box-measure-radio",
-                                   inline=True,
-                                   labelStyle={"display": "inline-block",
-                                               "padding": "10px"}),
-                    dcc.Graph(id="content-box-fig",
-                              style={"height": "45vh",
-                                     "margin": MARGIN_DICT})],
-                    style={"height": "45vh"})
-            ])
-        ],
-            width=6)
-    ],
-        style={"height": "50vh"})
-
-])
-
-# Define the whole app layout within a single container containing a single row.
-# The container/row contains 2 columns: a narrow sidebar (left), and a wide content box (right)
-app.layout = dbc.Container([
-    dbc.Row([
-        dbc.Col(sidebar, width=3, className="bg-light"),
-        # Sidebar, width 3
-        dbc.Col(content, width=9, className="bg-light")
-        # Content, width 9
-    ])
-],
-    fluid=True,
-    style={"height": "100vh"})
-
-
-# Filtering dataframe helper function to call within callback functions
-def filter_df(df, i_year, i_season, i_area, i_month, i_start_date, i_end_date):
-    # if an end date is selected in the date picker
-    if i_end_date is not None:
-        df["Overflow Event Start Time"] = pd.to_datetime(df["Overflow Event Start Time"], errors='coerce')
-
-        time_filtered_df = df.loc[
-            df["Overflow Event Start Time"].between(pd.to_datetime(i_start_date), pd.to_datetime(i_end_date))
-        ]
-
-        # Initialize mask as True
-        mask = pd.Series([True] * len(df))
-
-        # No Month, Year or Season Filters
-        filters_dict = {"Area": i_area}
-
-        chosen_filters_dict = filters_dict.copy()
-
-        for col, filter_value in filters_dict.items():
-            if filter_value == "All":
-                chosen_filters_dict.pop(col)
-
-        # Iterate through filters_dict and apply conditions to mask
-        for key, value in chosen_filters_dict.items():
-            if value is not None:  # Apply filter only if value is not None
-                mask &= time_filtered_df[key] == value
-
-        # Apply mask to filter the DataFrame
-        filtered_df = time_filtered_df[mask]
-
-        # Filter further to where Volume discharged and Duration > 0
-        filtered_df_final = filtered_df[
-            (filtered_df["Volume Discharged"] > 0) &
-            (filtered_df["Duration Mins"] > 0)
-            ].copy()
-        return filtered_df_final
-
-    # If no end date is selected then do full filtering process
-    if i_end_date is None:
-        # Initialize mask as True
-        mask = pd.Series([True] * len(df))
-
-        filters_dict = {"Year": i_year,
-                        "Season": i_season,
-                        "Area": i_area,
-                        "Month": i_month}
-
-        chosen_filters_dict = filters_dict.copy()
-
-        for col, filter_value in filters_dict.items():
-            if filter_value == "All":
-                chosen_filters_dict.pop(col)
-
-        # Iterate through filters_dict and apply conditions to mask
-        for key, value in chosen_filters_dict.items():
-            if value is not None:  # Apply filter only if value is not None
-                mask &= df[key] == value
-
-        # Apply mask to filter the DataFrame
-        filtered_df = df[mask]
-
-        # Filter further to where Volume discharged and duration > 0
-        filtered_df_final = filtered_df[
-            (filtered_df["Volume Discharged"] > 0) &
-            (filtered_df["Duration Mins"] > 0)
-            ].copy()
-        return filtered_df_final
-
-
-# Define updating callbacks
-
-#  Month dropdown if season selected
-@callback(Output("month-dropdown", "options"),
-          Input("season-dropdown", "value"))
-def update_month_dropdown(i_season):
-    if i_season != "All":
-        options = SEASON_MONTH_DICT[i_season]
-    if i_season == "All":
-        options = ALL_MONTHS
-    return options
-
-
-# Calculate Metrics for Sidebar based on Filters
-@app.callback([Output("sidebar-number-spills", "children"),
-               Output("sidebar-average-duration-mins", "children"),
-               Output("sidebar-average-discharge", "children"),
-               Output("sidebar-average-duration-mins", "style"),
-               Output("sidebar-average-discharge", "style")],
-              Input("year-dropdown", "value"),
-              Input("season-dropdown", "value"),
-              Input("area-dropdown", "value"),
-              Input("month-dropdown", "value"),
-              Input("sidebar-date-picker-range", "start_date"),
-              Input("sidebar-date-picker-range", "end_date")
-              )
-def update_sidebar_metrics(i_year, i_season, i_area, i_month, i_start_date, i_end_date):
-    filtered_df = filter_df(df, i_year, i_season, i_area, i_month, i_start_date, i_end_date)
-
-    if filtered_df.empty:
-        num_spills = 0
-        avg_duration = 0
-        avg_discharge = 0
-        avg_duration_color = None
-        avg_discharge_color = None
-
-    else:
-        num_spills = str(len(filtered_df))
-        avg_duration = str(round(np.mean(filtered_df["Duration Mins"]), 1))
-        avg_discharge = str(round(np.mean(filtered_df["Volume Discharged"]), 1))
-
-        avg_duration_float = round(np.mean(filtered_df["Duration Mins"]), 1)
-        avg_discharge_float = round(np.mean(filtered_df["Volume Discharged"]), 1)
-
-        duration_remainder = round(avg_duration_float - AVG_DURATION_MINS, 1)
-        duration_remainder_str = '(+' + str(duration_remainder) + ')' if duration_remainder > 0 else '(' + str(
-            duration_remainder) + ')'
-        discharge_remainder = round(avg_discharge_float - AVG_DISCHARGE, 1)
-        discharge_remainder_str = '(+' + str(discharge_remainder) + ')' if discharge_remainder > 0 else '(' + str(
-            discharge_remainder) + ')'
-
-        avg_duration = avg_duration + ' ' + duration_remainder_str
-        avg_discharge = avg_discharge + ' ' + discharge_remainder_str
-
-        # Colour text depending on its difference from whole dataset average
-        if avg_duration_float < AVG_DURATION_MINS:
-            avg_duration_color = {"color": "green"}
-        else:
-            avg_duration_color = {"color": "red"}
-
-        if avg_discharge_float < AVG_DISCHARGE:
-            avg_discharge_color = {"color": "green"}
-        else:
-            avg_discharge_color = {"color": "red"}
-
-    return num_spills, avg_duration, avg_discharge, avg_duration_color, avg_discharge_color
-
-
-# Update piechart of duration by source type
-@app.callback(
-    Output("sidebar-vol-pie", "figure"),
-    [Input("year-dropdown", "value"),
-     Input("season-dropdown", "value"),
-     Input("area-dropdown", "value"),
-     Input("month-dropdown", "value"),
-     Input("sidebar-date-picker-range", "start_date"),
-     Input("sidebar-date-picker-range", "end_date")
-     ])
-def update_sidebar_pie(i_year, i_season, i_area, i_month, i_start_date, i_end_date):
-    filtered_df = filter_df(df, i_year, i_season, i_area, i_month, i_start_date, i_end_date)
-
-    if filtered_df.empty:
-        empty_fig = px.pie(names=["No Data"],
-                           values=[1],
-                           title="Please reselect your filters (e.g., Date range)",
-                           template="seaborn")
-        empty_fig.update_layout(margin=MARGIN_DICT,
-                                plot_bgcolor='rgba(0, 0, 0, 0)',
-                                paper_bgcolor='rgba(0, 0, 0, 0)')
-        return empty_fig
-
-    pie_fig = px.pie(data_frame=filtered_df,
-                     names="Source Type",
-                     values="Duration Mins",
-                     color="Source Type",
-                     template="seaborn",
-                     title=f"<b>Sewage Overflow Duration by Source Type</b>")
-
-    pie_fig.update_layout(margin=MARGIN_DICT,
-                          plot_bgcolor='rgba(0, 0, 0, 0)',
-                          paper_bgcolor='rgba(0, 0, 0, 0)'
-                          )
-
-    return pie_fig
-
-
-# Update a map plot of filtered locations, sized points by Volume Discharge and Coloured by Source Type
-@callback(
-    Output("content-map-fig", "figure"),
-    [Input("year-dropdown", "value"),
-     Input("season-dropdown", "value"),
-     Input("area-dropdown", "value"),
-     Input("month-dropdown", "value"),
-     Input("sidebar-date-picker-range", "start_date"),
-     Input("sidebar-date-picker-range", "end_date")])
-def update_content_map(i_year, i_season, i_area, i_month, i_start_date, i_end_date):
-    filtered_df = filter_df(df, i_year, i_season, i_area, i_month, i_start_date, i_end_date)
-
-    filtered_df = filtered_df[["Asset Name", "Year", "Source Type", "Latitude", "Longitude", "Volume Discharged"]]
-
-    if filtered_df.empty:
-        empty_fig = px.pie(names=["No Data"],
-                           values=[1],
-                           title="Please reselect your filters (e.g., Date range)",
-                           template="seaborn")
-        empty_fig.update_layout(margin=MARGIN_DICT,
-                                plot_bgcolor='rgba(0, 0, 0, 0)',  # transparent plot area
-                                paper_bgcolor='rgba(0, 0, 0, 0)')
-        return empty_fig
-
-    filtered_df = filtered_df.groupby(by=["Asset Name", "Year", "Source Type", "Latitude", "Longitude"],
-                                      as_index=False).sum()
-    num_sources_str = str(len(np.unique(filtered_df["Asset Name"])))
-    map_fig = px.scatter_map(filtered_df,
-                             lat="Latitude",
-                             lon="Longitude",
-                             color="Source Type",
-                             size="Volume Discharged",
-                             size_max=50,
-                             zoom=7,
-                             template="seaborn",
-                             hover_name="Asset Name",
-                             title=f"<b>Sewage Overflow Sources: {num_sources_str}<b>",
-                             center={"lat": 56.24936914381658,
-                                     "lon": -3.8824581054934506})
-    map_fig.update_layout(margin=MARGIN_DICT,
-                          plot_bgcolor='rgba(0, 0, 0, 0)',  # transparent plot area
-                          paper_bgcolor='rgba(0, 0, 0, 0)',
-                          title={
-                              'xanchor': 'center',
-                              'yanchor': 'top'},
-                          showlegend=False)
-
-    return map_fig
-
-
-# Update line/bar chart of Discharge and Time, coloured by Source Type
-@callback(
-    Output("content-discharge-time-fig", "figure"),
-    [Input("year-dropdown", "value"),
-     Input("season-dropdown", "value"),
-     Input("area-dropdown", "value"),
-     Input("month-dropdown", "value"),
-     Input("timeframe-dropdown", "value"),
-     Input("sidebar-date-picker-range", "start_date"),
-     Input("sidebar-date-picker-range", "end_date")])
-def update_content_discharge_time(i_year, i_season, i_area, i_month, i_time_frame, i_start_date, i_end_date):
-    filtered_df = filter_df(df, i_year, i_season, i_area, i_month, i_start_date, i_end_date)
-
-    if filtered_df.empty:
-        empty_fig = px.pie(names=["No Data"],
-                           values=[1],
-                           title="Please reselect your filters (e.g., Date range)",
-                           template="seaborn")
-        empty_fig.update_layout(margin=MARGIN_DICT,
-                                plot_bgcolor='rgba(0, 0, 0, 0)',
-                                paper_bgcolor='rgba(0, 0, 0, 0)')
-        return empty_fig
-
-    filtered_df = filtered_df[[i_time_frame, "Volume Discharged", "Source Type"]]
-
-    # Line Charts
-    if i_time_frame == "Overflow Event Start Time":
-        line_fig = px.line(data_frame=filtered_df.sort_values(by=i_time_frame, ascending=True),
-                           x=i_time_frame,
-                           y="Volume Discharged",
-                           color="Source Type",
-                           line_group="Source Type",
-                           title=f"<b>Volume Discharged over time<b>",
-                           template="seaborn")
-        line_fig.update_layout(margin=MARGIN_DICT,
-                               plot_bgcolor='rgba(0, 0, 0, 0)',
-                               paper_bgcolor='rgba(0, 0, 0, 0)',
-                               showlegend=False)
-        return line_fig
-
-    if i_time_frame == "Start Minute":
-        filtered_df = (filtered_df[["Start Minute", "Volume Discharged", "Source Type"]].groupby(
-            by=["Start Minute", "Source Type"], as_index=False).sum())
-        line_fig = px.line(data_frame=filtered_df.sort_values(by=i_time_frame, ascending=True),
-                           x=i_time_frame,
-                           y="Volume Discharged",
-                           color="Source Type",
-                           line_group="Source Type",
-                           title=f"<b>Volume Discharged by {i_time_frame}<b>",
-                           template="seaborn")
-        line_fig.update_layout(margin=MARGIN_DICT,
-                               plot_bgcolor='rgba(0, 0, 0, 0)',
-                               paper_bgcolor='rgba(0, 0, 0, 0)',
-                               showlegend=False)
-        return line_fig
-
-    # Bar Charts
-    if i_time_frame == "Start Hour":
-        filtered_df = (filtered_df[[i_time_frame, "Volume Discharged", "Source Type"]].groupby(
-            by=[i_time_frame, "Source Type"], as_index=False).sum())
-        bar_fig = px.histogram(data_frame=filtered_df,
-                               x=i_time_frame,
-                               y="Volume Discharged",
-                               color="Source Type",
-                               title=f"<b>Volume Discharged by {i_time_frame}<b>",
-                               barmode="group",
-                               template="seaborn")
-        bar_fig.update_layout(margin=MARGIN_DICT,
-                              plot_bgcolor='rgba(0, 0, 0, 0)',
-                              paper_bgcolor='rgba(0, 0, 0, 0)',
-                              showlegend=False)
-        return bar_fig
-
-    if i_time_frame == "Week day":
-        filtered_df = (filtered_df[[i_time_frame, "Volume Discharged", "Source Type"]].groupby(
-            by=[i_time_frame, "Source Type"], as_index=False).sum())
-        bar_fig = px.histogram(data_frame=filtered_df,
-                               x=i_time_frame,
-                               y="Volume Discharged",
-                               color="Source Type",
-                               title=f"<b>Volume Discharged by {i_time_frame}<b>",
-                               barmode="group",
-                               template="seaborn")
-        bar_fig.update_layout(margin=MARGIN_DICT,
-                              plot_bgcolor='rgba(0, 0, 0, 0)',  # transparent plot area
-                              paper_bgcolor='rgba(0, 0, 0, 0)',
-                              showlegend=False)
-        return bar_fig
-
-
-# Asset performance viewer - barplot
-@callback(
-    Output("content-asset-performance-fig", "figure"),
-    [Input("year-dropdown", "value"),
-     Input("season-dropdown", "value"),
-     Input("area-dropdown", "value"),
-     Input("month-dropdown", "value"),
-     Input("discharge-duration-radio", "value"),
-     Input("best-worst-radio", "value"),
-     Input("assets-shown-input", "value"),
-     Input("sidebar-date-picker-range", "start_date"),
-     Input("sidebar-date-picker-range", "end_date")])
-def update_content_asset_bar(i_year, i_season, i_area, i_month, discharge_time, best_worst, num_shown, i_start_date,
-                             i_end_date):
-    filtered_df = filter_df(df, i_year, i_season, i_area, i_month, i_start_date, i_end_date)
-
-    if filtered_df.empty:
-        empty_fig = px.pie(names=["No Data"],
-                           values=[1],
-                           title="Please reselect your filters (e.g., Date range)",
-                           template="seaborn")
-        empty_fig.update_layout(margin=MARGIN_DICT,
-                                plot_bgcolor='rgba(0, 0, 0, 0)',
-                                paper_bgcolor='rgba(0, 0, 0, 0)')
-        return empty_fig
-
-    # Filter df and return number of assets
-    filtered_df = filtered_df[["Asset Name", "Source Type", "Volume Discharged", "Duration Mins"]]
-    max_assets = len(np.unique(filtered_df["Asset Name"]))
-
-    # Create a total duration mins and total discharge mins column (for sorting on) for each asset
-    filtered_df["asset_total_duration_mins"] = filtered_df.groupby(by=["Asset Name", "Source Type"])[
-        "Duration Mins"].transform("sum")
-    filtered_df["asset_total_volume_discharged"] = filtered_df.groupby(by=["Asset Name", "Source Type"])[
-        "Volume Discharged"].transform("sum")
-
-    if num_shown > max_assets or num_shown <= 0 or num_shown is None:
-        num_shown = 1
-
-    # Determine sorting order based on 'Best' or 'Worst' selection
-    ascending_order = (best_worst == "Best")
-
-    # Group, sum, and sort the DataFrame by the user metric choice
-    if discharge_time == "Volume Discharged":
-        grouped_df = (filtered_df.groupby(["Asset Name", "Source Type"], as_index=False)
-                      .sum()
-                      .sort_values(by="asset_total_volume_discharged",
-                                   ascending=ascending_order)
-                      .head(num_shown)).reset_index(drop=True)
-        # Get the order of "Asset Name" based on sorted values
-        category_order = grouped_df.sort_values(by="asset_total_volume_discharged", ascending=ascending_order)[
-            "Asset Name"].tolist()
-
-    elif discharge_time == "Duration Mins":
-        grouped_df = (filtered_df.groupby(["Asset Name", "Source Type"], as_index=False)
-                      .sum()
-                      .sort_values(by="asset_total_duration_mins",
-                                   ascending=ascending_order)
-                      .head(num_shown)).reset_index(drop=True)
-        # Get the order of "Asset Name" based on sorted values
-        category_order = grouped_df.sort_values(by="asset_total_duration_mins", ascending=ascending_order)[
-            "Asset Name"].tolist()
-
-        # Generate bar plot
-    bar_plot = px.bar(
-        data_frame=grouped_df,
-        x="Asset Name",
-        y=discharge_time,
-        color="Source Type",
-        barmode="stack",
-        title=f"<b>Asset Performance by {discharge_time}<b>",
-        template="seaborn",
-        hover_name="Asset Name",
-        category_orders={"Asset Name": category_order})
-
-    bar_plot.update_layout(
-        margin=MARGIN_DICT,
-        plot_bgcolor='rgba(0, 0, 0, 0)',
-        paper_bgcolor='rgba(0, 0, 0, 0)',
-        showlegend=False
-    )
-
-    return bar_plot
-
-
-# Horizontal Box Plots of Volume Discharged and Duration
-@callback(Output("content-box-fig", "figure"),
-          [Input("year-dropdown", "value"),
-           Input("season-dropdown", "value"),
-           Input("area-dropdown", "value"),
-           Input("month-dropdown", "value"),
-           Input("box-measure-radio", "value"),
-           Input("sidebar-date-picker-range", "start_date"),
-           Input("sidebar-date-picker-range", "end_date")])
-def update_overflow_distribution(i_year, i_season, i_area, i_month, i_box_measure, i_start_date, i_end_date):
-    filtered_df = filter_df(df, i_year, i_season, i_area, i_month, i_start_date, i_end_date)
-
-    if filtered_df.empty:
-        empty_fig = px.pie(names=["No Data"],
-                           values=[1],
-                           title="Please reselect your filters (e.g., Date range)",
-                           template="seaborn")
-        empty_fig.update_layout(margin=MARGIN_DICT,
-                                plot_bgcolor='rgba(0, 0, 0, 0)',
-                                paper_bgcolor='rgba(0, 0, 0, 0)')
-        return empty_fig
-
-    # Make log_y if more than 4 orders of magnitude (oom) difference between min and max
-    diff = np.max(filtered_df[i_box_measure]) - np.min(filtered_df[i_box_measure])
-    oom = math.floor(math.log(diff, 10))
-
-    if oom >= 5:
-
-        boxplot = px.box(data_frame=filtered_df,
-                         y="Source Type",
-                         x=i_box_measure,
-                         color="Source Type",
-                         orientation="h",
-                         template="seaborn",
-                         hover_name="Asset Name",
-                         hover_data=["Duration Mins"],
-                         title=f"<b>{i_box_measure}<b>",
-                         log_x=True)
-        boxplot.update_layout(margin=MARGIN_DICT,
-                              paper_bgcolor="rgba(0,0,0,0)",
-                              plot_bgcolor="rgba(0,0,0,0)",
-                              hovermode=False,
-                              showlegend=False)
-        boxplot.update_traces(hoverinfo="skip")
-        return boxplot
-    else:
-        boxplot = px.box(data_frame=filtered_df,
-                         y="Source Type",
-                         x=i_box_measure,
-                         color="Source Type",
-                         orientation="h",
-                         template="seaborn",
-                         hover_name="Asset Name",
-                         hover_data=["Duration Mins"],
-                         title=f"<b>{i_box_measure}<b>",
-                         log_x=False)
-
-    boxplot.update_layout(margin=MARGIN_DICT,
-                          paper_bgcolor="rgba(0,0,0,0)",
-                          plot_bgcolor="rgba(0,0,0,0)",
-                          hovermode=False,
-                          showlegend=False)
-    boxplot.update_traces(hoverinfo="skip")
-
-    return boxplot
-
-
-# Run application
-if __name__ == "__main__":
-    app.run(debug=True)  # run_serverfor deployed version
+# Import packages
+import functools
+import hashlib
+import io
+import json
+import math
+import os
+import pickle
+import stat
+import sys
+import threading
+import time
+from datetime import date, datetime
+import urllib.request
+from urllib.parse import urlencode
+
+# Boot stage timings (seconds), reported once the app is built and by the /ready route
+BOOT_TIMINGS = {}
+
+
+def record_boot_stage(stage, started):
+    """Store the time taken by a boot stage and return the start time of the next one"""
+    now = time.perf_counter()
+    BOOT_TIMINGS[stage] = round(now - started, 4)
+    return now
+
+
+_stage_start = time.perf_counter()
+
+# Only the layout packages are imported up front. pandas, numpy and plotly_express are imported
+# inside the functions that need them so a worker can answer before the data is loaded.
+from dash import Dash, html, dcc
+from dash.dependencies import Input, Output
+import dash_bootstrap_components as dbc
+
+_stage_start = record_boot_stage("import dash", _stage_start)
+
+# Read in csv as a pandas dataframe
+#https://raw.githubusercontent.com/twrighta/scottish-water-sewage-dashapp/refs/heads/main/no_missing_scottish_sewage_spills.csv
+df_path = 'https://raw.githubusercontent.com/twrighta/scottish-water-sewage-dashapp/main/no_missing_scottish_sewage_spills.csv'
+
+# Dropdown options and whole dataset averages cached alongside the data snapshot, so the layout
+# can be built without downloading the csv. The cache records the url and sha256 of the csv it was
+# built from and is rebuilt when the loaded csv differs. gunicorn.conf.py builds it in the gunicorn
+# master before any worker starts; it can also be regenerated by hand with:
+#   python scottish_water_dash_deploy.py --write-metadata
+METADATA_PATH = os.environ.get("SEWAGE_METADATA_PATH",
+                               os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                            "no_missing_scottish_sewage_spills_metadata.json"))
+
+# Loaded data, filled on first use by get_df()
+_data = {}
+_data_lock = threading.Lock()
+
+
+def read_csv_bytes(path):
+    """Read the csv (a url or a local file) as bytes, so it can be hashed and parsed"""
+    if "://" in path:
+        with urllib.request.urlopen(path) as response:
+            return response.read()
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def load_data():
+    """Download the csv and compute the dataframes the callbacks need"""
+    started = time.perf_counter()
+    import pandas as pd
+    started = record_boot_stage("import pandas", started)
+
+    csv_bytes = read_csv_bytes(df_path)
+    csv_sha256 = hashlib.sha256(csv_bytes).hexdigest()
+    started = record_boot_stage("download csv", started)
+
+    df = pd.read_csv(io.BytesIO(csv_bytes))
+    # Parsed once here: df is shared read-only by all requests, so filter_df must not modify it
+    df["Overflow Event Start Time"] = pd.to_datetime(df["Overflow Event Start Time"], errors='coerce')
+    started = record_boot_stage("read csv", started)
+
+    # Whole dataset metrics for metric text colour formatting
+    df_no_0 = df[
+        (df["Duration Mins"] > 0) &
+        (df["Volume Discharged"] > 0)
+        ].copy()
+    record_boot_stage("prepare data", started)
+    return {"df": df,
+            "df_no_0": df_no_0,
+            "csv_sha256": csv_sha256}
+
+
+def get_data():
+    """Return the loaded data, loading it on the first call (thread safe)"""
+    if not _data:
+        with _data_lock:
+            if not _data:
+                data = load_data()
+                check_metadata(data)
+                _data.update(data)
+    return _data
+
+
+def get_df():
+    return get_data()["df"]
+
+
+_sketch_lock = threading.Lock()
+
+
+def get_sketches():
+    """Return the cube cell sketches, building them from the data on the first call (thread safe)"""
+    if "sketches" not in _data:
+        data = get_data()
+        with _sketch_lock:
+            if "sketches" not in data:
+                data["sketches"] = build_sketches(data["df_no_0"])
+    return _data["sketches"]
+
+
+def build_metadata(data):
+    """Create the json-serialisable dropdown options and averages for the loaded data"""
+    import numpy as np
+
+    df = data["df"]
+    df_no_0 = data["df_no_0"]
+
+    def unique_list(col):
+        # tolist() converts numpy scalars to python types for json
+        return np.unique(df[col]).tolist()
+
+    return {"csv_url": df_path,
+            "csv_sha256": data["csv_sha256"],
+            "assets": unique_list("Asset Name"),
+            "years": unique_list("Year"),
+            "seasons": unique_list("Season"),
+            "source_types": unique_list("Source Type"),
+            "areas": unique_list("Area"),
+            "months": unique_list("Month"),
+            "avg_duration_mins": float(np.nanmean(df_no_0["Duration Mins"])),
+            "avg_discharge": float(np.nanmean(df_no_0["Volume Discharged"]))}
+
+
+def read_metadata():
+    """Read the cached metadata, or return {} if there is none"""
+    try:
+        with open(METADATA_PATH) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def write_metadata(metadata):
+    """Write the metadata atomically, so concurrently booting workers never read a partial file"""
+    tmp_path = f"{METADATA_PATH}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(metadata, f, indent=1)
+    os.replace(tmp_path, METADATA_PATH)
+
+
+def set_metadata(metadata):
+    """Set the dropdown options and whole dataset averages used by the layout and callbacks"""
+    global METADATA, ALL_ASSETS, ALL_YEARS, ALL_SEASONS, ALL_SOURCE_TYPES, ALL_AREAS, ALL_MONTHS
+    global AVG_DURATION_MINS, AVG_DISCHARGE
+
+    METADATA = metadata
+
+    # Create lists of unique categories for dashboard filtering
+    ALL_ASSETS = list(metadata["assets"])
+    ALL_YEARS = list(metadata["years"])
+    ALL_SEASONS = list(metadata["seasons"])
+    ALL_SOURCE_TYPES = list(metadata["source_types"])
+    ALL_AREAS = list(metadata["areas"])
+    ALL_MONTHS = list(metadata["months"])
+
+    # Append 'All...' to Years, Seasons, Areas, Months
+    ALL_YEARS.append("All")
+    ALL_MONTHS.append("All")
+    ALL_AREAS.append("All")
+    ALL_SEASONS.append("All")
+
+    AVG_DURATION_MINS = metadata["avg_duration_mins"]
+    AVG_DISCHARGE = metadata["avg_discharge"]
+
+
+def check_metadata(data):
+    """Rebuild the metadata if it is missing or was built from a different csv than the one loaded"""
+    if METADATA.get("csv_url") == df_path and METADATA.get("csv_sha256") == data["csv_sha256"]:
+        return
+    if METADATA:
+        print(f"Cached metadata in {METADATA_PATH} does not match {df_path}, rebuilding it", file=sys.stderr)
+
+    metadata = build_metadata(data)
+    try:
+        write_metadata(metadata)
+    except OSError:
+        # Read-only deployments still work, they just rebuild the metadata after every boot
+        pass
+    set_metadata(metadata)
+
+
+def ensure_metadata():
+    """Make sure the metadata is set, loading the data if there was no cached metadata"""
+    if not METADATA:
+        get_data()
+
+
+# Without a cached file the metadata is set when the data is first loaded, never at import
+METADATA = {}
+_cached_metadata = read_metadata()
+if _cached_metadata:
+    set_metadata(_cached_metadata)
+_stage_start = record_boot_stage("load metadata", _stage_start)
+
+SEASON_MONTH_DICT = {"Winter": ["November", "December", "January"],
+                     "Spring": ["February", "March", "April"],
+                     "Summer": ["May", "June", "July"],
+                     "Autumn": ["August", "September", "October"]}
+
+# Approximate statistics mode: the data is pre-aggregated into cube cells (one per combination of
+# CUBE_DIMS). Each cell keeps its count, sum, min and max and a log-bucket quantile sketch
+# (DDSketch) per measure, so any dropdown selection is answered by merging cells, not rows.
+CUBE_DIMS = ["Year", "Season", "Area", "Month", "Source Type"]
+SKETCH_MEASURES = ["Duration Mins", "Volume Discharged"]
+# Quantiles are within this relative error of a true data value
+SKETCH_RELATIVE_ACCURACY = 0.01
+SKETCH_GAMMA = (1 + SKETCH_RELATIVE_ACCURACY) / (1 - SKETCH_RELATIVE_ACCURACY)
+
+# Filtered data export: rows serialised per streamed chunk (and per Parquet row group)
+EXPORT_CHUNK_ROWS = 50000
+EXPORT_FORMATS = {"csv": "text/csv",
+                  "parquet": "application/vnd.apache.parquet"}
+
+# Other Global Formatting Variables
+MARGIN_DICT = {"l": 10,
+               "r": 10,
+               "t": 30,
+               "b": 10}
+PLOT_STYLE = {"height": "90vh",
+              "width": "90vh"}
+
+
+# Create the sidebar:
+def make_sidebar():
+    return html.Div([
+        #  Options Header Section
+        dbc.Row([
+            html.H2("Filters and Options",
+                    style={"margin-top": "10px",
+                           "margin-left": "10px",
+                           "margin-right": "10px",
+                           "border-radius": "10px",
+                           "width": "95%"},
+                    className="bg-primary text-white font-italic")
+        ],
+            style={"height": "5vh",
+                   "fontWeight": "bold"}),
+
+        # Filtering Dropdown Options Section
+        dbc.Row([
+            dbc.Col([
+                html.P("Year",
+                       style={"padding": "5px",
+                              "font-weight": "bold"}),
+                dcc.Dropdown(options=ALL_YEARS,
+                             value=ALL_YEARS[0],
+                             id="year-dropdown",
+                             placeholder="Select Year",
+                             style={"border-radius": "10px"}),
+                html.P("Area",
+                       style={"padding": "5px",
+                              "font-weight": "bold"}),
+                dcc.Dropdown(options=ALL_AREAS,
+                             value=ALL_AREAS[0],
+                             id="area-dropdown",
+                             placeholder="Select Area",
+                             style={"border-radius": "10px"})
+            ]),
+            dbc.Col([
+                html.P("Season",
+                       style={"padding": "5px",
+                              "font-weight": "bold"}),
+                dcc.Dropdown(
+                    options=[{"label": html.Span(["Winter"], style={"color": "blue"}),
+                              "value": "Winter"},
+                             {"label": html.Span(["Spring"], style={"color": "green"}),
+                              "value": "Spring"},
+                             {"label": html.Span(["Summer"], style={"color": "orange"}),
+                              "value": "Summer"},
+                             {"label": html.Span(["Autumn"], style={"color": "purple"}),
+                              "value": "Autumn"},
+                             {"label": html.Span(["All"], style={"color": "black"}),
+                              "value": "All"}
+                             ],
+                    value=ALL_SEASONS[0],
+                    id="season-dropdown",
+                    placeholder="Select Season",
+                    style={"border-radius": "10px"}),
+                html.P("Month",
+                       style={"padding": "5px",
+                              "font-weight": "bold"}),
+                dcc.Dropdown(options=ALL_MONTHS,
+                             value=ALL_MONTHS[1],
+                             id="month-dropdown",
+                             placeholder="Select Month(s)",
+                             style={"border-radius": "10px"})
+            ])
+        ],
+            style={"height": "20vh"}),
+
+        # DatePickerRange
+        dbc.Row([
+            dcc.DatePickerRange(
+                start_date=date(2019, 1, 1),
+                end_date=None,
+                end_date_placeholder_text="End date",
+                id="sidebar-date-picker-range",
+                style={"width": "400"},
+                clearable=True,
+                minimum_nights=1,
+                min_date_allowed=date(2019, 1, 1)
+            )
+        ],
+            style={"height": "5vh",
+                   "justify-content": "space-around",
+                   "flex": "1",
+                   "border-radius": "10px"}),
+
+        # Download the rows behind the current filters (hrefs set by update_export_links)
+        dbc.Row([
+            dbc.Col([
+                html.A("Download CSV",
+                       id="export-csv-link",
+                       href="",
+                       className="btn btn-outline-primary btn-sm")
+            ]),
+            dbc.Col([
+                html.A("Download Parquet",
+                       id="export-parquet-link",
+                       href="",
+                       className="btn btn-outline-primary btn-sm")
+            ])
+        ],
+            style={"padding": "5px"}),
+
+        # Metrics Section
+        dbc.Row([
+            dbc.Col([
+                html.H4("Number of Spills"),
+                html.H5(id="sidebar-number-spills",
+                        style={"font-weight": "bold"})
+            ]),
+            dbc.Col([
+                html.H4("Average Duration (Mins)"),
+                html.H5(id="sidebar-average-duration-mins",
+                        style={"font-weight": "bold"})
+            ]),
+            dbc.Col([
+                html.H4("Average Discharge (m3)"),
+                html.H5(id="sidebar-average-discharge",
+                        style={"font-weight": "bold"})
+            ]),
+            # Exact statistics scan every filtered row, approximate ones merge per-cell sketches
+            html.Div([
+                dcc.RadioItems(id="stats-mode-radio",
+                               options=["Exact", "Approximate"],
+                               value="Exact",
+                               inline=True,
+                               labelStyle={"display": "inline-block",
+                                           "padding": "10px"}),
+                html.Small(id="stats-error-bound",
+                           style={"font-style": "italic"})
+            ]),
+            html.Hr()],
+            style={"height": "30vh"}),
+
+        # Pie chart of Volume Discharged by Source Type
+        dbc.Row([
+            dcc.Graph(id="sidebar-vol-pie",
+                      style={"height": "30vh"})
+        ],
+            style={"height": "37.5vh"}),
+
+        # Tom Credits
+        dbc.Row([
+            html.H4("by Tom Wright-Anderson",
+                    className="bg-primary text-white font-italic",
+                    style={"border-radius": "10px",
+                           "width": "95%"})
+        ],
+            style={"fontWeight": "bold",
+                   "height": "2.5vh"})
+
+    ])
+
+
+# Content Section:
+# Top Left: Plot of the Point Locations. Coloured by Source Type, Sized by Volume Discharged
+# Top Right: Line/bar chart of Discharge (y) and Time (coloured by Source Type)
+# Bottom Left: Asset stacked bar plot viewer. Select Number and Best/Worst filter.
+# Bottom Right: 2 Plots: Horizontal Box Plots of Duration and Volume Discharged coloured by Source Type
+
+def make_content():
+    return html.Div([
+        dbc.Row([
+            dbc.Col([
+                dcc.Graph(id="content-map-fig",
+                          style={"height": "45vh",
+                                 "margins": MARGIN_DICT})
+            ],
+                width=6),
+            dbc.Col([
+                html.Div([
+                    dcc.Dropdown(options=["Overflow Event Start Time",
+                                          "Start Minute",
+                                          "Start Hour",
+                                          "Week day"],
+                                 value="Overflow Event Start Time",
+                                 placeholder="Please select a timeframe",
+                                 id="timeframe-dropdown",
+                                 style={"border-radius": "10px",
+                                        "width": "70%",
+                                        "padding": "2px",
+                                        "justify-content": "space-around"}),
+                    dcc.Graph(id="content-discharge-time-fig",
+                              style={"height": "45vh"})
+                ])
+            ],
+                width=6)
+        ],
+            style={"height": "50vh"}),
+
+        # Lower Plots
+        dbc.Row([
+            dbc.Col([
+                html.Div([
+                    dcc.RadioItems(id="discharge-duration-radio",
+                                   options=["Duration Mins", "Volume Discharged"],
+                                   value="Duration Mins",
+                                   inline=True,
+                                   labelStyle={"display": "inline-block",
+                                               "padding": "10px"}
+                                   ),
+                    dcc.RadioItems(id="best-worst-radio",
+                                   options=["Best", "Worst"],
+                                   value="Worst",
+                                   inline=True,
+                                   labelStyle={"display": "inline-block",
+                                               "padding": "10px"}
+                                   ),
+                    dcc.Input(id="assets-shown-input",
+                              type="number",
+                              value=3,
+                              placeholder="Number of Assets",
+                              step=1,
+                              min=0,
+                              style={"border-radius": "10px",
+                                     "text-align": "center"})
+                ]),
+                html.Div([
+                    dcc.Graph(id="content-asset-performance-fig",
+                              style={"height": "40vh",
+                                     "margins": MARGIN_DICT})
+                ])
+            ],
+                width=6),
+            # Box Plots:
+            dbc.Col([
+                dbc.Col([
+                    html.Div([
+                        dcc.RadioItems(options=["Duration Mins", "Volume Discharged"],
+                                       value="Duration Mins",
+                                       id="box-measure-radio",
+                                       inline=True,
+                                       labelStyle={"display": "inline-block",
+                                                   "padding": "10px"}),
+                        dcc.Graph(id="content-box-fig",
+                                  style={"height": "45vh",
+                                         "margin": MARGIN_DICT})],
+                        style={"height": "45vh"})
+                ])
+            ],
+                width=6)
+        ],
+            style={"height": "50vh"})
+
+    ])
+
+
+# Define the whole app layout within a single container containing a single row.
+# The container/row contains 2 columns: a narrow sidebar (left), and a wide content box (right)
+# Dash calls this on each page load, so the layout is never built at import time.
+def make_layout():
+    ensure_metadata()
+    return dbc.Container([
+        dbc.Row([
+            dbc.Col(make_sidebar(), width=3, className="bg-light"),
+            # Sidebar, width 3
+            dbc.Col(make_content(), width=9, className="bg-light")
+            # Content, width 9
+        ])
+    ],
+        fluid=True,
+        style={"height": "100vh"})
+
+
+# Request coalescing: concurrent callers with identical inputs (e.g. everyone opening the dashboard
+# on the default filters after a deploy) wait for one computation and share its result.
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Run a computation once for all concurrent callers with the same key
+
+    Within a worker, callers wait for the thread already computing the key. With lock_dir set,
+    workers also coordinate through an flock'd file per key in it (POSIX only): a worker that finds
+    the key's lock taken leaves a ".wait" marker and blocks on the lock. The computing worker
+    pickles its result for them only if a marker exists. Waiters only use a result written after
+    they started waiting. Results, markers and idle lock files older than result_ttl seconds are
+    deleted. Because results are unpickled, lock_dir is only used if it is private to this user.
+    """
+
+    def __init__(self, lock_dir=None, result_ttl=30):
+        self.lock_dir = lock_dir
+        self.result_ttl = result_ttl
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._lock_dir_private = None
+
+    def do(self, key, fn, *args):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = self._compute(key, fn, args)
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result
+
+    def _compute(self, key, fn, args):
+        if self.lock_dir is None:
+            return fn(*args)
+
+        import fcntl
+
+        if not self._check_lock_dir():
+            return fn(*args)
+
+        # repr of the str/int/None keys is the same in every worker. Each key has its own lock file,
+        # so nested calls (a callback calling get_filtered_df) never wait on a lock they hold.
+        digest = hashlib.sha1(repr(key).encode()).hexdigest()
+        lock_path = os.path.join(self.lock_dir, digest + ".lock")
+        result_path = os.path.join(self.lock_dir, digest + ".pkl")
+        wait_path = os.path.join(self.lock_dir, digest + ".wait")
+
+        requested_at = time.time()
+        lock_file = self._acquire(lock_path, wait_path)
+        try:
+            # A result written while this worker waited came from the in-flight computation
+            try:
+                if os.path.getmtime(result_path) >= requested_at:
+                    with open(result_path, "rb") as f:
+                        return pickle.load(f)
+            except (OSError, pickle.UnpicklingError, EOFError):
+                pass
+
+            result = fn(*args)
+            if os.path.exists(wait_path):
+                tmp_path = result_path + ".tmp"
+                with open(tmp_path, "wb") as f:
+                    pickle.dump(result, f, protocol=pickle.HIGHEST_PROTOCOL)
+                os.replace(tmp_path, result_path)
+                try:
+                    os.remove(wait_path)
+                except OSError:
+                    pass
+            return result
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+            lock_file.close()
+            self._remove_expired()
+
+    def _check_lock_dir(self):
+        """Create lock_dir (mode 0o700) and check that no other user can write to it
+
+        Another user able to write there (e.g. having created the directory first under /dev/shm)
+        could plant a pickle and run code as the app, so such a directory is not used.
+        """
+        if self._lock_dir_private is None:
+            os.makedirs(self.lock_dir, mode=0o700, exist_ok=True)
+            st = os.lstat(self.lock_dir)
+            self._lock_dir_private = (stat.S_ISDIR(st.st_mode) and
+                                      st.st_uid == os.getuid() and
+                                      not st.st_mode & 0o022)
+            if not self._lock_dir_private:
+                print(f"{self.lock_dir} is not a directory owned by this user and writable only by it, "
+                      f"coalescing within this worker only", file=sys.stderr)
+        return self._lock_dir_private
+
+    def _acquire(self, lock_path, wait_path):
+        """Open and flock the key's lock file, leaving a wait marker if another worker holds it"""
+        import fcntl
+
+        while True:
+            lock_file = open(lock_path, "a")
+            try:
+                try:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    # Another worker may be computing this key: ask it to publish its result
+                    open(wait_path, "a").close()
+                    fcntl.flock(lock_file, fcntl.LOCK_EX)
+                # _remove_expired may have deleted the file before it was locked here, in which
+                # case it no longer guards the key: retry with the file now at lock_path
+                if os.fstat(lock_file.fileno()).st_ino == os.stat(lock_path).st_ino:
+                    # The modification time marks the lock as in use for _remove_expired
+                    os.utime(lock_path)
+                    return lock_file
+            except FileNotFoundError:
+                pass
+            except BaseException:
+                lock_file.close()
+                raise
+            lock_file.close()
+
+    def _remove_expired(self):
+        """Delete results, wait markers and idle lock files older than result_ttl"""
+        import fcntl
+
+        expired_before = time.time() - self.result_ttl
+        for name in os.listdir(self.lock_dir):
+            path = os.path.join(self.lock_dir, name)
+            try:
+                if os.path.getmtime(path) >= expired_before:
+                    continue
+                if not name.endswith(".lock"):
+                    os.remove(path)
+                    continue
+                # Only delete a lock file nobody holds, and while holding it, so a worker that
+                # opened it just before can tell (in _acquire) that it was replaced
+                fd = os.open(path, os.O_RDONLY)
+                try:
+                    fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    if os.path.getmtime(path) < expired_before:
+                        os.remove(path)
+                except BlockingIOError:
+                    pass
+                finally:
+                    os.close(fd)
+            except OSError:
+                pass
+
+
+# Shared by the filter and figure layers; set SEWAGE_COALESCE_DIR to coalesce across workers too
+FLIGHTS = SingleFlight(lock_dir=os.environ.get("SEWAGE_COALESCE_DIR"))
+
+
+def coalesced(func):
+    """Decorator coalescing concurrent calls of a callback with identical inputs"""
+    @functools.wraps(func)
+    def wrapper(*args):
+        return FLIGHTS.do((func.__name__,) + args, func, *args)
+
+    return wrapper
+
+
+# Filtering dataframe helper function to call within callback functions
+def filter_df(df, i_year, i_season, i_area, i_month, i_start_date, i_end_date):
+    import pandas as pd
+
+    # if an end date is selected in the date picker
+    if i_end_date is not None:
+        time_filtered_df = df.loc[
+            df["Overflow Event Start Time"].between(pd.to_datetime(i_start_date), pd.to_datetime(i_end_date))
+        ]
+
+        # Initialize mask as True
+        mask = pd.Series([True] * len(df))
+
+        # No Month, Year or Season Filters
+        filters_dict = {"Area": i_area}
+
+        chosen_filters_dict = filters_dict.copy()
+
+        for col, filter_value in filters_dict.items():
+            if filter_value == "All":
+                chosen_filters_dict.pop(col)
+
+        # Iterate through filters_dict and apply conditions to mask
+        for key, value in chosen_filters_dict.items():
+            if value is not None:  # Apply filter only if value is not None
+                mask &= time_filtered_df[key] == value
+
+        # Apply mask to filter the DataFrame
+        filtered_df = time_filtered_df[mask]
+
+        # Filter further to where Volume discharged and Duration > 0
+        filtered_df_final = filtered_df[
+            (filtered_df["Volume Discharged"] > 0) &
+            (filtered_df["Duration Mins"] > 0)
+            ].copy()
+        return filtered_df_final
+
+    # If no end date is selected then do full filtering process
+    if i_end_date is None:
+        # Initialize mask as True
+        mask = pd.Series([True] * len(df))
+
+        filters_dict = {"Year": i_year,
+                        "Season": i_season,
+                        "Area": i_area,
+                        "Month": i_month}
+
+        chosen_filters_dict = filters_dict.copy()
+
+        for col, filter_value in filters_dict.items():
+            if filter_value == "All":
+                chosen_filters_dict.pop(col)
+
+        # Iterate through filters_dict and apply conditions to mask
+        for key, value in chosen_filters_dict.items():
+            if value is not None:  # Apply filter only if value is not None
+                mask &= df[key] == value
+
+        # Apply mask to filter the DataFrame
+        filtered_df = df[mask]
+
+        # Filter further to where Volume discharged and duration > 0
+        filtered_df_final = filtered_df[
+            (filtered_df["Volume Discharged"] > 0) &
+            (filtered_df["Duration Mins"] > 0)
+            ].copy()
+        return filtered_df_final
+
+
+def get_filtered_df(i_year, i_season, i_area, i_month, i_start_date, i_end_date):
+    """filter_df on the full data, coalesced with concurrent calls for the same filters
+
+    Inputs filter_df ignores are normalised first so equivalent selections share one computation.
+    The returned dataframe may be shared between callers and must not be modified in place.
+    """
+    if i_end_date is None:
+        i_start_date = None
+    else:
+        # Date ranges only filter on Area
+        i_year = i_season = i_month = None
+    key = ("filter_df",) + tuple("All" if value is None else value
+                                 for value in (i_year, i_season, i_area, i_month, i_start_date, i_end_date))
+    return FLIGHTS.do(key, filter_df, get_df(), i_year, i_season, i_area, i_month, i_start_date, i_end_date)
+
+
+# Approximate statistics helpers
+def build_sketches(df_no_0):
+    """Aggregate the non-zero spills into per cube cell moments and quantile sketch buckets
+
+    Returns a dict with "moments" (one row per cell with "<measure> count/sum/min/max" columns)
+    and, per measure, a table of (cell, bucket) counts. Bucket i holds values in
+    (SKETCH_GAMMA ** (i - 1), SKETCH_GAMMA ** i], which all measures fit as they are > 0.
+    """
+    import numpy as np
+
+    grouped = df_no_0.groupby(CUBE_DIMS, observed=True)
+    moments = grouped[SKETCH_MEASURES].agg(["count", "sum", "min", "max"])
+    moments.columns = [f"{measure} {stat}" for measure, stat in moments.columns]
+    sketches = {"moments": moments.reset_index()}
+
+    for measure in SKETCH_MEASURES:
+        buckets = np.ceil(np.log(df_no_0[measure]) / np.log(SKETCH_GAMMA)).astype(int)
+        sketches[measure] = (df_no_0[CUBE_DIMS]
+                             .assign(bucket=buckets)
+                             .groupby(CUBE_DIMS + ["bucket"], observed=True)
+                             .size()
+                             .rename("count")
+                             .reset_index())
+    return sketches
+
+
+def select_cells(cells_df, i_year, i_season, i_area, i_month):
+    """Select the sketch rows of the cells matching the dropdown filters, as filter_df does for rows"""
+    filters_dict = {"Year": i_year,
+                    "Season": i_season,
+                    "Area": i_area,
+                    "Month": i_month}
+
+    import pandas as pd
+
+    mask = pd.Series(True, index=cells_df.index)
+    for key, value in filters_dict.items():
+        if value is not None and value != "All":
+            mask &= cells_df[key] == value
+    return cells_df[mask]
+
+
+def sketch_quantiles(bucket_counts, quantiles):
+    """Estimate quantiles from merged bucket counts (a Series of counts indexed by sorted bucket)
+
+    Interpolates between ranks like Plotly's default "linear" quartile method (zero based position
+    q * n - 0.5), so the estimates are within SKETCH_RELATIVE_ACCURACY of the exact box plot's.
+    """
+    import numpy as np
+
+    cumulative = bucket_counts.to_numpy().cumsum()
+    count = cumulative[-1]
+    positions = np.clip(np.asarray(quantiles) * count - 0.5, 0, count - 1)
+    lower_ranks = np.floor(positions)
+    fractions = positions - lower_ranks
+
+    def rank_values(ranks):
+        buckets = bucket_counts.index.to_numpy()[np.searchsorted(cumulative, ranks, side="right")]
+        # Bucket midpoint (in relative terms), within SKETCH_RELATIVE_ACCURACY of any value in it
+        return 2 * SKETCH_GAMMA ** buckets / (SKETCH_GAMMA + 1)
+
+    # Interpolating two values that are each within the relative error keeps the same bound
+    return (1 - fractions) * rank_values(lower_ranks) + fractions * rank_values(np.ceil(positions))
+
+
+def approx_box_stats(i_year, i_season, i_area, i_month, measure):
+    """Box plot statistics per Source Type, merged from the selected cells' sketches"""
+    sketches = get_sketches()
+    moments = select_cells(sketches["moments"], i_year, i_season, i_area, i_month)
+    buckets = select_cells(sketches[measure], i_year, i_season, i_area, i_month)
+    if moments.empty:
+        return {}
+
+    moments = moments.groupby("Source Type").agg({f"{measure} count": "sum",
+                                                   f"{measure} min": "min",
+                                                   f"{measure} max": "max"})
+    bucket_counts = buckets.groupby(["Source Type", "bucket"])["count"].sum()
+
+    box_stats = {}
+    for source_type, row in moments.iterrows():
+        q1, median, q3 = sketch_quantiles(bucket_counts.loc[source_type], [0.25, 0.5, 0.75])
+        iqr = q3 - q1
+        box_stats[source_type] = {"q1": q1,
+                                  "median": median,
+                                  "q3": q3,
+                                  # Whiskers at 1.5 IQR, clipped to the exact cell min/max
+                                  "lowerfence": max(row[f"{measure} min"], q1 - 1.5 * iqr),
+                                  "upperfence": min(row[f"{measure} max"], q3 + 1.5 * iqr),
+                                  "min": row[f"{measure} min"],
+                                  "max": row[f"{measure} max"]}
+    return box_stats
+
+
+# Filtered data export helpers
+class _ChunkSink(io.RawIOBase):
+    """Write-only file object that keeps written bytes until they are drained into a response"""
+
+    def __init__(self):
+        super().__init__()
+        self.chunks = []
+        self.position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        self.chunks.append(bytes(b))
+        self.position += len(b)
+        return len(b)
+
+    def tell(self):
+        return self.position
+
+    def drain(self):
+        data = b"".join(self.chunks)
+        self.chunks.clear()
+        return data
+
+
+def export_csv_chunks(filtered_df):
+    """Yield the dataframe as csv text, EXPORT_CHUNK_ROWS rows at a time"""
+    if filtered_df.empty:
+        yield filtered_df.to_csv(index=False)
+    for start in range(0, len(filtered_df), EXPORT_CHUNK_ROWS):
+        yield filtered_df.iloc[start:start + EXPORT_CHUNK_ROWS].to_csv(index=False, header=start == 0)
+
+
+def export_parquet_chunks(filtered_df):
+    """Yield the dataframe as parquet bytes, one row group of EXPORT_CHUNK_ROWS rows at a time"""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    sink = _ChunkSink()
+    schema = pa.Schema.from_pandas(filtered_df, preserve_index=False)
+    with pq.ParquetWriter(sink, schema) as writer:
+        for start in range(0, len(filtered_df), EXPORT_CHUNK_ROWS):
+            chunk = filtered_df.iloc[start:start + EXPORT_CHUNK_ROWS]
+            writer.write_table(pa.Table.from_pandas(chunk, schema=schema, preserve_index=False))
+            yield sink.drain()
+    # Footer written when the writer closes
+    yield sink.drain()
+
+
+def export_query_date(value):
+    """Check an export query string date (as sent by the date picker), returning None if missing
+
+    Raises ValueError for anything that isn't an ISO format date or datetime.
+    """
+    if value is None or value == "":
+        return None
+    datetime.fromisoformat(value)
+    return value
+
+
+def export_query_value(value):
+    """Convert an export query string value back to the filter value used by the dropdowns"""
+    if value is None or value == "":
+        return None
+    # Years are integers in the data
+    if value.isdigit():
+        return int(value)
+    return value
+
+
+# Define updating callbacks
+# Callbacks are collected here and registered on each app by create_app(), so every app built by
+# the factory gets the full set (the global dash.callback list is consumed by the first app only).
+DASHBOARD_CALLBACKS = []
+
+
+def dashboard_callback(*args, **kwargs):
+    """Decorator taking the same arguments as Dash.callback, deferring registration to create_app()"""
+    def decorator(func):
+        DASHBOARD_CALLBACKS.append((args, kwargs, func))
+        return func
+
+    return decorator
+
+
+def register_callbacks(dash_app):
+    for args, kwargs, func in DASHBOARD_CALLBACKS:
+        dash_app.callback(*args, **kwargs)(func)
+
+
+#  Month dropdown if season selected
+@dashboard_callback(Output("month-dropdown", "options"),
+          Input("season-dropdown", "value"))
+def update_month_dropdown(i_season):
+    ensure_metadata()
+    if i_season != "All":
+        options = SEASON_MONTH_DICT[i_season]
+    if i_season == "All":
+        options = ALL_MONTHS
+    return options
+
+
+# Calculate Metrics for Sidebar based on Filters
+@dashboard_callback([Output("sidebar-number-spills", "children"),
+           Output("sidebar-average-duration-mins", "children"),
+           Output("sidebar-average-discharge", "children"),
+           Output("sidebar-average-duration-mins", "style"),
+           Output("sidebar-average-discharge", "style")],
+          Input("year-dropdown", "value"),
+          Input("season-dropdown", "value"),
+          Input("area-dropdown", "value"),
+          Input("month-dropdown", "value"),
+          Input("sidebar-date-picker-range", "start_date"),
+          Input("sidebar-date-picker-range", "end_date"),
+          Input("stats-mode-radio", "value")
+          )
+@coalesced
+def update_sidebar_metrics(i_year, i_season, i_area, i_month, i_start_date, i_end_date, i_stats_mode):
+    import numpy as np
+
+    # Cube cells are whole months, so date ranges always use the exact rows
+    if i_stats_mode == "Approximate" and i_end_date is None:
+        cell_moments = select_cells(get_sketches()["moments"], i_year, i_season, i_area, i_month)
+        spill_count = int(cell_moments["Duration Mins count"].sum())
+        if spill_count > 0:
+            mean_duration = cell_moments["Duration Mins sum"].sum() / spill_count
+            mean_discharge = cell_moments["Volume Discharged sum"].sum() / spill_count
+    else:
+        filtered_df = get_filtered_df(i_year, i_season, i_area, i_month, i_start_date, i_end_date)
+        spill_count = len(filtered_df)
+        if spill_count > 0:
+            mean_duration = np.mean(filtered_df["Duration Mins"])
+            mean_discharge = np.mean(filtered_df["Volume Discharged"])
+
+    if spill_count == 0:
+        num_spills = 0
+        avg_duration = 0
+        avg_discharge = 0
+        avg_duration_color = None
+        avg_discharge_color = None
+
+    else:
+        num_spills = str(spill_count)
+        avg_duration = str(round(mean_duration, 1))
+        avg_discharge = str(round(mean_discharge, 1))
+
+        avg_duration_float = round(mean_duration, 1)
+        avg_discharge_float = round(mean_discharge, 1)
+
+        duration_remainder = round(avg_duration_float - AVG_DURATION_MINS, 1)
+        duration_remainder_str = '(+' + str(duration_remainder) + ')' if duration_remainder > 0 else '(' + str(
+            duration_remainder) + ')'
+        discharge_remainder = round(avg_discharge_float - AVG_DISCHARGE, 1)
+        discharge_remainder_str = '(+' + str(discharge_remainder) + ')' if discharge_remainder > 0 else '(' + str(
+            discharge_remainder) + ')'
+
+        avg_duration = avg_duration + ' ' + duration_remainder_str
+        avg_discharge = avg_discharge + ' ' + discharge_remainder_str
+
+        # Colour text depending on its difference from whole dataset average
+        if avg_duration_float < AVG_DURATION_MINS:
+            avg_duration_color = {"color": "green"}
+        else:
+            avg_duration_color = {"color": "red"}
+
+        if avg_discharge_float < AVG_DISCHARGE:
+            avg_discharge_color = {"color": "green"}
+        else:
+            avg_discharge_color = {"color": "red"}
+
+    return num_spills, avg_duration, avg_discharge, avg_duration_color, avg_discharge_color
+
+
+# Point the download links at the export route for the current filters
+@dashboard_callback([Output("export-csv-link", "href"),
+           Output("export-parquet-link", "href")],
+          Input("year-dropdown", "value"),
+          Input("season-dropdown", "value"),
+          Input("area-dropdown", "value"),
+          Input("month-dropdown", "value"),
+          Input("sidebar-date-picker-range", "start_date"),
+          Input("sidebar-date-picker-range", "end_date"))
+def update_export_links(i_year, i_season, i_area, i_month, i_start_date, i_end_date):
+    filters = {"year": i_year,
+               "season": i_season,
+               "area": i_area,
+               "month": i_month,
+               "start_date": i_start_date,
+               "end_date": i_end_date}
+    query = urlencode({key: value for key, value in filters.items() if value is not None})
+    return f"/export.csv?{query}", f"/export.parquet?{query}"
+
+
+# State the error bound of the selected statistics mode under the mode selector
+@dashboard_callback(Output("stats-error-bound", "children"),
+          Input("stats-mode-radio", "value"),
+          Input("sidebar-date-picker-range", "end_date"))
+def update_stats_error_bound(i_stats_mode, i_end_date):
+    if i_stats_mode != "Approximate":
+        return "Exact statistics over every filtered spill."
+    if i_end_date is not None:
+        return "Date ranges are not cell aligned: showing exact statistics."
+    return (f"Approximate: counts, averages and min/max are exact per-cell totals; "
+            f"box plot quartiles are within \u00b1{SKETCH_RELATIVE_ACCURACY:.0%} of the exact quartiles.")
+
+
+# Update piechart of duration by source type
+@dashboard_callback(
+    Output("sidebar-vol-pie", "figure"),
+    [Input("year-dropdown", "value"),
+     Input("season-dropdown", "value"),
+     Input("area-dropdown", "value"),
+     Input("month-dropdown", "value"),
+     Input("sidebar-date-picker-range", "start_date"),
+     Input("sidebar-date-picker-range", "end_date")
+     ])
+@coalesced
+def update_sidebar_pie(i_year, i_season, i_area, i_month, i_start_date, i_end_date):
+    import plotly_express as px
+
+    filtered_df = get_filtered_df(i_year, i_season, i_area, i_month, i_start_date, i_end_date)
+
+    if filtered_df.empty:
+        empty_fig = px.pie(names=["No Data"],
+                           values=[1],
+                           title="Please reselect your filters (e.g., Date range)",
+                           template="seaborn")
+        empty_fig.update_layout(margin=MARGIN_DICT,
+                                plot_bgcolor='rgba(0, 0, 0, 0)',
+                                paper_bgcolor='rgba(0, 0, 0, 0)')
+        return empty_fig
+
+    pie_fig = px.pie(data_frame=filtered_df,
+                     names="Source Type",
+                     values="Duration Mins",
+                     color="Source Type",
+                     template="seaborn",
+                     title=f"<b>Sewage Overflow Duration by Source Type</b>")
+
+    pie_fig.update_layout(margin=MARGIN_DICT,
+                          plot_bgcolor='rgba(0, 0, 0, 0)',
+                          paper_bgcolor='rgba(0, 0, 0, 0)'
+                          )
+
+    return pie_fig
+
+
+# Update a map plot of filtered locations, sized points by Volume Discharge and Coloured by Source Type
+@dashboard_callback(
+    Output("content-map-fig", "figure"),
+    [Input("year-dropdown", "value"),
+     Input("season-dropdown", "value"),
+     Input("area-dropdown", "value"),
+     Input("month-dropdown", "value"),
+     Input("sidebar-date-picker-range", "start_date"),
+     Input("sidebar-date-picker-range", "end_date")])
+@coalesced
+def update_content_map(i_year, i_season, i_area, i_month, i_start_date, i_end_date):
+    import numpy as np
+    import plotly_express as px
+
+    filtered_df = get_filtered_df(i_year, i_season, i_area, i_month, i_start_date, i_end_date)
+
+    filtered_df = filtered_df[["Asset Name", "Year", "Source Type", "Latitude", "Longitude", "Volume Discharged"]]
+
+    if filtered_df.empty:
+        empty_fig = px.pie(names=["No Data"],
+                           values=[1],
+                           title="Please reselect your filters (e.g., Date range)",
+                           template="seaborn")
+        empty_fig.update_layout(margin=MARGIN_DICT,
+                                plot_bgcolor='rgba(0, 0, 0, 0)',  # transparent plot area
+                                paper_bgcolor='rgba(0, 0, 0, 0)')
+        return empty_fig
+
+    filtered_df = filtered_df.groupby(by=["Asset Name", "Year", "Source Type", "Latitude", "Longitude"],
+                                      as_index=False).sum()
+    num_sources_str = str(len(np.unique(filtered_df["Asset Name"])))
+    map_fig = px.scatter_map(filtered_df,
+                             lat="Latitude",
+                             lon="Longitude",
+                             color="Source Type",
+                             size="Volume Discharged",
+                             size_max=50,
+                             zoom=7,
+                             template="seaborn",
+                             hover_name="Asset Name",
+                             title=f"<b>Sewage Overflow Sources: {num_sources_str}<b>",
+                             center={"lat": 56.24936914381658,
+                                     "lon": -3.8824581054934506})
+    map_fig.update_layout(margin=MARGIN_DICT,
+                          plot_bgcolor='rgba(0, 0, 0, 0)',  # transparent plot area
+                          paper_bgcolor='rgba(0, 0, 0, 0)',
+                          title={
+                              'xanchor': 'center',
+                              'yanchor': 'top'},
+                          showlegend=False)
+
+    return map_fig
+
+
+# Update line/bar chart of Discharge and Time, coloured by Source Type
+@dashboard_callback(
+    Output("content-discharge-time-fig", "figure"),
+    [Input("year-dropdown", "value"),
+     Input("season-dropdown", "value"),
+     Input("area-dropdown", "value"),
+     Input("month-dropdown", "value"),
+     Input("timeframe-dropdown", "value"),
+     Input("sidebar-date-picker-range", "start_date"),
+     Input("sidebar-date-picker-range", "end_date")])
+@coalesced
+def update_content_discharge_time(i_year, i_season, i_area, i_month, i_time_frame, i_start_date, i_end_date):
+    import plotly_express as px
+
+    filtered_df = get_filtered_df(i_year, i_season, i_area, i_month, i_start_date, i_end_date)
+
+    if filtered_df.empty:
+        empty_fig = px.pie(names=["No Data"],
+                           values=[1],
+                           title="Please reselect your filters (e.g., Date range)",
+                           template="seaborn")
+        empty_fig.update_layout(margin=MARGIN_DICT,
+                                plot_bgcolor='rgba(0, 0, 0, 0)',
+                                paper_bgcolor='rgba(0, 0, 0, 0)')
+        return empty_fig
+
+    filtered_df = filtered_df[[i_time_frame, "Volume Discharged", "Source Type"]]
+
+    # Line Charts
+    if i_time_frame == "Overflow Event Start Time":
+        line_fig = px.line(data_frame=filtered_df.sort_values(by=i_time_frame, ascending=True),
+                           x=i_time_frame,
+                           y="Volume Discharged",
+                           color="Source Type",
+                           line_group="Source Type",
+                           title=f"<b>Volume Discharged over time<b>",
+                           template="seaborn")
+        line_fig.update_layout(margin=MARGIN_DICT,
+                               plot_bgcolor='rgba(0, 0, 0, 0)',
+                               paper_bgcolor='rgba(0, 0, 0, 0)',
+                               showlegend=False)
+        return line_fig
+
+    if i_time_frame == "Start Minute":
+        filtered_df = (filtered_df[["Start Minute", "Volume Discharged", "Source Type"]].groupby(
+            by=["Start Minute", "Source Type"], as_index=False).sum())
+        line_fig = px.line(data_frame=filtered_df.sort_values(by=i_time_frame, ascending=True),
+                           x=i_time_frame,
+                           y="Volume Discharged",
+                           color="Source Type",
+                           line_group="Source Type",
+                           title=f"<b>Volume Discharged by {i_time_frame}<b>",
+                           template="seaborn")
+        line_fig.update_layout(margin=MARGIN_DICT,
+                               plot_bgcolor='rgba(0, 0, 0, 0)',
+                               paper_bgcolor='rgba(0, 0, 0, 0)',
+                               showlegend=False)
+        return line_fig
+
+    # Bar Charts
+    if i_time_frame == "Start Hour":
+        filtered_df = (filtered_df[[i_time_frame, "Volume Discharged", "Source Type"]].groupby(
+            by=[i_time_frame, "Source Type"], as_index=False).sum())
+        bar_fig = px.histogram(data_frame=filtered_df,
+                               x=i_time_frame,
+                               y="Volume Discharged",
+                               color="Source Type",
+                               title=f"<b>Volume Discharged by {i_time_frame}<b>",
+                               barmode="group",
+                               template="seaborn")
+        bar_fig.update_layout(margin=MARGIN_DICT,
+                              plot_bgcolor='rgba(0, 0, 0, 0)',
+                              paper_bgcolor='rgba(0, 0, 0, 0)',
+                              showlegend=False)
+        return bar_fig
+
+    if i_time_frame == "Week day":
+        filtered_df = (filtered_df[[i_time_frame, "Volume Discharged", "Source Type"]].groupby(
+            by=[i_time_frame, "Source Type"], as_index=False).sum())
+        bar_fig = px.histogram(data_frame=filtered_df,
+                               x=i_time_frame,
+                               y="Volume Discharged",
+                               color="Source Type",
+                               title=f"<b>Volume Discharged by {i_time_frame}<b>",
+                               barmode="group",
+                               template="seaborn")
+        bar_fig.update_layout(margin=MARGIN_DICT,
+                              plot_bgcolor='rgba(0, 0, 0, 0)',  # transparent plot area
+                              paper_bgcolor='rgba(0, 0, 0, 0)',
+                              showlegend=False)
+        return bar_fig
+
+
+# Asset performance viewer - barplot
+@dashboard_callback(
+    Output("content-asset-performance-fig", "figure"),
+    [Input("year-dropdown", "value"),
+     Input("season-dropdown", "value"),
+     Input("area-dropdown", "value"),
+     Input("month-dropdown", "value"),
+     Input("discharge-duration-radio", "value"),
+     Input("best-worst-radio", "value"),
+     Input("assets-shown-input", "value"),
+     Input("sidebar-date-picker-range", "start_date"),
+     Input("sidebar-date-picker-range", "end_date")])
+@coalesced
+def update_content_asset_bar(i_year, i_season, i_area, i_month, discharge_time, best_worst, num_shown, i_start_date,
+                             i_end_date):
+    import numpy as np
+    import plotly_express as px
+
+    filtered_df = get_filtered_df(i_year, i_season, i_area, i_month, i_start_date, i_end_date)
+
+    if filtered_df.empty:
+        empty_fig = px.pie(names=["No Data"],
+                           values=[1],
+                           title="Please reselect your filters (e.g., Date range)",
+                           template="seaborn")
+        empty_fig.update_layout(margin=MARGIN_DICT,
+                                plot_bgcolor='rgba(0, 0, 0, 0)',
+                                paper_bgcolor='rgba(0, 0, 0, 0)')
+        return empty_fig
+
+    # Filter df and return number of assets
+    filtered_df = filtered_df[["Asset Name", "Source Type", "Volume Discharged", "Duration Mins"]]
+    max_assets = len(np.unique(filtered_df["Asset Name"]))
+
+    # Create a total duration mins and total discharge mins column (for sorting on) for each asset
+    filtered_df["asset_total_duration_mins"] = filtered_df.groupby(by=["Asset Name", "Source Type"])[
+        "Duration Mins"].transform("sum")
+    filtered_df["asset_total_volume_discharged"] = filtered_df.groupby(by=["Asset Name", "Source Type"])[
+        "Volume Discharged"].transform("sum")
+
+    if num_shown > max_assets or num_shown <= 0 or num_shown is None:
+        num_shown = 1
+
+    # Determine sorting order based on 'Best' or 'Worst' selection
+    ascending_order = (best_worst == "Best")
+
+    # Group, sum, and sort the DataFrame by the user metric choice
+    if discharge_time == "Volume Discharged":
+        grouped_df = (filtered_df.groupby(["Asset Name", "Source Type"], as_index=False)
+                      .sum()
+                      .sort_values(by="asset_total_volume_discharged",
+                                   ascending=ascending_order)
+                      .head(num_shown)).reset_index(drop=True)
+        # Get the order of "Asset Name" based on sorted values
+        category_order = grouped_df.sort_values(by="asset_total_volume_discharged", ascending=ascending_order)[
+            "Asset Name"].tolist()
+
+    elif discharge_time == "Duration Mins":
+        grouped_df = (filtered_df.groupby(["Asset Name", "Source Type"], as_index=False)
+                      .sum()
+                      .sort_values(by="asset_total_duration_mins",
+                                   ascending=ascending_order)
+                      .head(num_shown)).reset_index(drop=True)
+        # Get the order of "Asset Name" based on sorted values
+        category_order = grouped_df.sort_values(by="asset_total_duration_mins", ascending=ascending_order)[
+            "Asset Name"].tolist()
+
+        # Generate bar plot
+    bar_plot = px.bar(
+        data_frame=grouped_df,
+        x="Asset Name",
+        y=discharge_time,
+        color="Source Type",
+        barmode="stack",
+        title=f"<b>Asset Performance by {discharge_time}<b>",
+        template="seaborn",
+        hover_name="Asset Name",
+        category_orders={"Asset Name": category_order})
+
+    bar_plot.update_layout(
+        margin=MARGIN_DICT,
+        plot_bgcolor='rgba(0, 0, 0, 0)',
+        paper_bgcolor='rgba(0, 0, 0, 0)',
+        showlegend=False
+    )
+
+    return bar_plot
+
+
+# Horizontal Box Plots of Volume Discharged and Duration
+@dashboard_callback(Output("content-box-fig", "figure"),
+          [Input("year-dropdown", "value"),
+           Input("season-dropdown", "value"),
+           Input("area-dropdown", "value"),
+           Input("month-dropdown", "value"),
+           Input("box-measure-radio", "value"),
+           Input("sidebar-date-picker-range", "start_date"),
+           Input("sidebar-date-picker-range", "end_date"),
+           Input("stats-mode-radio", "value")])
+@coalesced
+def update_overflow_distribution(i_year, i_season, i_area, i_month, i_box_measure, i_start_date, i_end_date,
+                                 i_stats_mode):
+    import numpy as np
+    import plotly_express as px
+
+    if i_stats_mode == "Approximate" and i_end_date is None:
+        return approx_overflow_distribution(i_year, i_season, i_area, i_month, i_box_measure)
+
+    filtered_df = get_filtered_df(i_year, i_season, i_area, i_month, i_start_date, i_end_date)
+
+    if filtered_df.empty:
+        empty_fig = px.pie(names=["No Data"],
+                           values=[1],
+                           title="Please reselect your filters (e.g., Date range)",
+                           template="seaborn")
+        empty_fig.update_layout(margin=MARGIN_DICT,
+                                plot_bgcolor='rgba(0, 0, 0, 0)',
+                                paper_bgcolor='rgba(0, 0, 0, 0)')
+        return empty_fig
+
+    # Make log_y if more than 4 orders of magnitude (oom) difference between min and max
+    diff = np.max(filtered_df[i_box_measure]) - np.min(filtered_df[i_box_measure])
+    oom = math.floor(math.log(diff, 10))
+
+    if oom >= 5:
+
+        boxplot = px.box(data_frame=filtered_df,
+                         y="Source Type",
+                         x=i_box_measure,
+                         color="Source Type",
+                         orientation="h",
+                         template="seaborn",
+                         hover_name="Asset Name",
+                         hover_data=["Duration Mins"],
+                         title=f"<b>{i_box_measure}<b>",
+                         log_x=True)
+        boxplot.update_layout(margin=MARGIN_DICT,
+                              paper_bgcolor="rgba(0,0,0,0)",
+                              plot_bgcolor="rgba(0,0,0,0)",
+                              hovermode=False,
+                              showlegend=False)
+        boxplot.update_traces(hoverinfo="skip")
+        return boxplot
+    else:
+        boxplot = px.box(data_frame=filtered_df,
+                         y="Source Type",
+                         x=i_box_measure,
+                         color="Source Type",
+                         orientation="h",
+                         template="seaborn",
+                         hover_name="Asset Name",
+                         hover_data=["Duration Mins"],
+                         title=f"<b>{i_box_measure}<b>",
+                         log_x=False)
+
+    boxplot.update_layout(margin=MARGIN_DICT,
+                          paper_bgcolor="rgba(0,0,0,0)",
+                          plot_bgcolor="rgba(0,0,0,0)",
+                          hovermode=False,
+                          showlegend=False)
+    boxplot.update_traces(hoverinfo="skip")
+
+    return boxplot
+
+
+# Box plots drawn from sketch quartiles instead of the filtered rows (approximate statistics mode)
+def approx_overflow_distribution(i_year, i_season, i_area, i_month, i_box_measure):
+    import plotly.graph_objects as go
+    import plotly_express as px
+
+    box_stats = approx_box_stats(i_year, i_season, i_area, i_month, i_box_measure)
+
+    if not box_stats:
+        empty_fig = px.pie(names=["No Data"],
+                           values=[1],
+                           title="Please reselect your filters (e.g., Date range)",
+                           template="seaborn")
+        empty_fig.update_layout(margin=MARGIN_DICT,
+                                plot_bgcolor='rgba(0, 0, 0, 0)',
+                                paper_bgcolor='rgba(0, 0, 0, 0)')
+        return empty_fig
+
+    boxplot = go.Figure()
+    for source_type, stats in box_stats.items():
+        boxplot.add_trace(go.Box(y=[source_type],
+                                 q1=[stats["q1"]],
+                                 median=[stats["median"]],
+                                 q3=[stats["q3"]],
+                                 lowerfence=[stats["lowerfence"]],
+                                 upperfence=[stats["upperfence"]],
+                                 name=source_type,
+                                 orientation="h"))
+
+    # Same order of magnitude check as the exact plot, from the exact cell min/max
+    diff = max(s["max"] for s in box_stats.values()) - min(s["min"] for s in box_stats.values())
+    oom = math.floor(math.log(diff, 10)) if diff > 0 else 0
+
+    boxplot.update_layout(template="seaborn",
+                          title=f"<b>{i_box_measure} (approximate)<b>",
+                          xaxis_title=i_box_measure,
+                          xaxis_type="log" if oom >= 5 else "linear",
+                          margin=MARGIN_DICT,
+                          paper_bgcolor="rgba(0,0,0,0)",
+                          plot_bgcolor="rgba(0,0,0,0)",
+                          hovermode=False,
+                          showlegend=False)
+    boxplot.update_traces(hoverinfo="skip")
+
+    return boxplot
+
+
+def create_app():
+    """App factory: build the Dash app without loading the data
+
+    Each call returns a new app with its own layout, callbacks and routes. The data is shared
+    between apps and loaded by the first callback, or earlier by calling the /ready route.
+    """
+    started = time.perf_counter()
+    dash_app = Dash(__name__,
+                    suppress_callback_exceptions=True,
+                    external_stylesheets=[dbc.themes.FLATLY])
+    dash_app.layout = make_layout
+    register_callbacks(dash_app)
+
+    # Readiness hook for load balancers / autoscalers: loads the data so the worker's first
+    # real request is not slowed down by the csv download
+    @dash_app.server.route("/ready")
+    def ready():
+        get_data()
+        return {"status": "ready",
+                "boot_timings": BOOT_TIMINGS}
+
+    # Stream the filtered rows in chunks so large exports are never held in memory as one file
+    @dash_app.server.route("/export.<file_format>")
+    def export(file_format):
+        from flask import Response, abort, request
+
+        if file_format not in EXPORT_FORMATS:
+            abort(404)
+        try:
+            start_date = export_query_date(request.args.get("start_date"))
+            end_date = export_query_date(request.args.get("end_date"))
+        except ValueError:
+            abort(400, "start_date and end_date must be ISO format dates (YYYY-MM-DD)")
+        # A date range needs both ends
+        if end_date is not None and start_date is None:
+            abort(400, "end_date requires a start_date")
+
+        filtered_df = get_filtered_df(export_query_value(request.args.get("year")),
+                                      export_query_value(request.args.get("season")),
+                                      export_query_value(request.args.get("area")),
+                                      export_query_value(request.args.get("month")),
+                                      start_date,
+                                      end_date)
+        chunks = export_csv_chunks(filtered_df) if file_format == "csv" else export_parquet_chunks(filtered_df)
+        return Response(chunks,
+                        mimetype=EXPORT_FORMATS[file_format],
+                        headers={"Content-Disposition":
+                                 f"attachment; filename=scottish_sewage_spills_filtered.{file_format}"})
+
+    record_boot_stage("create app", started)
+    return dash_app
+
+
+_stage_start = record_boot_stage("define callbacks", _stage_start)
+
+# Instantiate Dashapp
+app = create_app()
+server = app.server
+
+print("Boot timings (s): " + ", ".join(f"{stage}={secs}" for stage, secs in BOOT_TIMINGS.items()),
+      file=sys.stderr)
+
+# Run application
+if __name__ == "__main__":
+    if "--write-metadata" in sys.argv[1:]:
+        # Regenerate the metadata cache from the current csv. With --if-missing (used by the
+        # gunicorn on_starting hook) an existing file is left alone.
+        if "--if-missing" in sys.argv[1:] and read_metadata():
+            print(f"{METADATA_PATH} already exists")
+        else:
+            write_metadata(build_metadata(load_data()))
+            print(f"Wrote {METADATA_PATH}")
+    else:
+        app.run(debug=True)  # run_serverfor deployed version
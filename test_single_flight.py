@@ -0,0 +1,212 @@
+import hashlib
+import multiprocessing
+import os
+import stat
+import sys
+import threading
+import time
+
+import pytest
+
+import scottish_water_dash_deploy
+from scottish_water_dash_deploy import SingleFlight
+
+
+def slow_compute(counter_path, value, seconds=1.0):
+    """Record the call in counter_path (one line per call, shared by processes) and return value"""
+    with open(counter_path, "a") as f:
+        f.write(f"{os.getpid()}\n")
+    time.sleep(seconds)
+    return value
+
+
+def test_threads_share_one_computation(tmp_path):
+    counter_path = tmp_path / "calls.txt"
+    flights = SingleFlight()
+    barrier = threading.Barrier(20)
+    results = []
+
+    def caller():
+        barrier.wait()
+        results.append(flights.do(("key",), slow_compute, counter_path, {"rows": 1}, 0.5))
+
+    threads = [threading.Thread(target=caller) for _ in range(20)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(counter_path.read_text().splitlines()) == 1
+    assert len(results) == 20
+    assert all(result is results[0] for result in results)
+    assert flights._calls == {}
+
+
+def test_errors_reach_every_waiter():
+    flights = SingleFlight()
+    barrier = threading.Barrier(5)
+    errors = []
+
+    def fail():
+        time.sleep(0.3)
+        raise ValueError("failed")
+
+    def caller():
+        barrier.wait()
+        try:
+            flights.do(("key",), fail)
+        except ValueError:
+            errors.append(1)
+
+    threads = [threading.Thread(target=caller) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(errors) == 5
+    assert flights._calls == {}
+
+
+def test_different_keys_are_not_coalesced(tmp_path):
+    counter_path = tmp_path / "calls.txt"
+    flights = SingleFlight()
+    assert flights.do(("a",), slow_compute, counter_path, 1, 0) == 1
+    assert flights.do(("b",), slow_compute, counter_path, 2, 0) == 2
+    assert len(counter_path.read_text().splitlines()) == 2
+
+
+def worker_process(lock_dir, counter_path, barrier, queue):
+    barrier.wait()
+    queue.put(SingleFlight(lock_dir=lock_dir).do(("key", 2020, "All"), slow_compute, counter_path, [1, 2, 3]))
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="cross-process coalescing uses fcntl")
+def test_processes_share_one_computation(tmp_path):
+    lock_dir = str(tmp_path / "locks")
+    counter_path = str(tmp_path / "calls.txt")
+    context = multiprocessing.get_context("fork")
+    barrier = context.Barrier(2)
+    queue = context.Queue()
+
+    processes = [context.Process(target=worker_process, args=(lock_dir, counter_path, barrier, queue))
+                 for _ in range(2)]
+    for process in processes:
+        process.start()
+    results = [queue.get(timeout=30) for _ in processes]
+    for process in processes:
+        process.join(timeout=30)
+
+    assert all(process.exitcode == 0 for process in processes)
+    assert results == [[1, 2, 3], [1, 2, 3]]
+    with open(counter_path) as f:
+        assert len(f.read().splitlines()) == 1
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="cross-process coalescing uses fcntl")
+def test_no_result_written_without_waiters(tmp_path):
+    flights = SingleFlight(lock_dir=str(tmp_path))
+
+    for n in range(50):
+        assert flights.do(("key", n), lambda value: value, n) == n
+
+    assert all(name.endswith(".lock") for name in os.listdir(tmp_path))
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="cross-process coalescing uses fcntl")
+def test_nested_calls_do_not_deadlock(tmp_path):
+    # Keys that shared one of 256 lock stripes in an earlier version, as a callback key and the
+    # filter_df key it computes inside do
+    outer = ("update_sidebar_pie", 2019, "Winter", "All", "November", "2019-01-01", None)
+    stripe = int(hashlib.sha1(repr(outer).encode()).hexdigest(), 16) % 256
+    inner = next(("filter_df", n, "All", "All", "All", "All", "All") for n in range(100000)
+                 if int(hashlib.sha1(repr(("filter_df", n, "All", "All", "All", "All", "All")).encode())
+                        .hexdigest(), 16) % 256 == stripe)
+    flights = SingleFlight(lock_dir=str(tmp_path))
+    results = []
+
+    def caller():
+        results.append(flights.do(outer, lambda: flights.do(inner, lambda: "filtered") + " figure"))
+
+    thread = threading.Thread(target=caller, daemon=True)
+    thread.start()
+    thread.join(timeout=10)
+
+    assert not thread.is_alive(), "nested do() calls deadlocked"
+    assert results == ["filtered figure"]
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="cross-process coalescing uses fcntl")
+def test_expired_results_are_removed(tmp_path):
+    flights = SingleFlight(lock_dir=str(tmp_path), result_ttl=30)
+    stale = [tmp_path / "stale.pkl", tmp_path / "stale.wait", tmp_path / "stale.lock"]
+    fresh = tmp_path / "fresh.pkl"
+    for path in stale + [fresh]:
+        path.write_bytes(b"")
+    an_hour_ago = time.time() - 3600
+    for path in stale:
+        os.utime(path, (an_hour_ago, an_hour_ago))
+
+    flights.do(("key",), lambda: None)
+
+    assert not any(path.exists() for path in stale)
+    assert fresh.exists()
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="cross-process coalescing uses fcntl")
+def test_held_lock_files_are_kept(tmp_path):
+    import fcntl
+
+    flights = SingleFlight(lock_dir=str(tmp_path), result_ttl=30)
+    held = tmp_path / "held.lock"
+    held.write_bytes(b"")
+    an_hour_ago = time.time() - 3600
+    os.utime(held, (an_hour_ago, an_hour_ago))
+
+    with open(held, "a") as held_file:
+        fcntl.flock(held_file, fcntl.LOCK_EX)
+        flights.do(("key",), lambda: None)
+        assert held.exists()
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="cross-process coalescing uses fcntl")
+def test_acquire_retries_when_lock_file_is_replaced(tmp_path, monkeypatch):
+    flights = SingleFlight(lock_dir=str(tmp_path))
+    lock_path = str(tmp_path / "key.lock")
+    replaced = []
+
+    def open_then_replace(path, *args, **kwargs):
+        # Simulate _remove_expired deleting the lock file between open and flock
+        f = open(path, *args, **kwargs)
+        if path == lock_path and not replaced:
+            os.remove(lock_path)
+            replaced.append(True)
+        return f
+
+    monkeypatch.setattr(scottish_water_dash_deploy, "open", open_then_replace, raising=False)
+    lock_file = flights._acquire(lock_path, str(tmp_path / "key.wait"))
+    monkeypatch.undo()
+
+    assert replaced
+    assert os.fstat(lock_file.fileno()).st_ino == os.stat(lock_path).st_ino
+    lock_file.close()
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="cross-process coalescing uses fcntl")
+def test_shared_lock_dir_is_not_used(tmp_path):
+    lock_dir = tmp_path / "shared"
+    lock_dir.mkdir()
+    os.chmod(lock_dir, 0o777)
+    (lock_dir / "planted.pkl").write_bytes(b"")
+    flights = SingleFlight(lock_dir=str(lock_dir))
+
+    assert flights.do(("key",), lambda: "computed") == "computed"
+    assert os.listdir(lock_dir) == ["planted.pkl"]
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="cross-process coalescing uses fcntl")
+def test_lock_dir_is_created_private(tmp_path):
+    lock_dir = tmp_path / "coalesce"
+    SingleFlight(lock_dir=str(lock_dir)).do(("key",), lambda: None)
+
+    assert stat.S_IMODE(os.stat(lock_dir).st_mode) & 0o077 == 0
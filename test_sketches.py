@@ -0,0 +1,63 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import scottish_water_dash_deploy as dashboard
+
+SEASON_MONTHS = {"Winter": ["November", "December", "January"],
+                 "Spring": ["February", "March", "April"],
+                 "Summer": ["May", "June", "July"],
+                 "Autumn": ["August", "September", "October"]}
+
+
+@pytest.fixture
+def synthetic_data(monkeypatch):
+    """Small per-cell samples of heavy tailed values, loaded in place of the csv"""
+    rng = np.random.default_rng(0)
+    n = 30000
+    month_season = {month: season for season, months in SEASON_MONTHS.items() for month in months}
+    df = pd.DataFrame({"Year": rng.integers(2019, 2024, n),
+                       "Month": rng.choice(list(month_season), n),
+                       "Area": rng.choice(["North", "South", "East", "West"], n),
+                       "Source Type": rng.choice(["CSO", "EO", "ST"], n),
+                       # Rounded like the real data, so cells contain repeated values too
+                       "Duration Mins": rng.lognormal(4, 2, n).round(1) + 0.1,
+                       "Volume Discharged": rng.lognormal(6, 3, n).round(2) + 0.01})
+    df["Season"] = df["Month"].map(month_season)
+    monkeypatch.setattr(dashboard, "_data", {"df": df, "df_no_0": df, "csv_sha256": ""})
+    return df
+
+
+@pytest.mark.parametrize("measure", dashboard.SKETCH_MEASURES)
+def test_quartiles_within_stated_bound(synthetic_data, measure):
+    # Plotly's default "linear" quartiles, which the exact box plot draws
+    def exact_quartiles(values):
+        return np.quantile(values, [0.25, 0.5, 0.75], method="hazen")
+
+    selections = [(year, "All", area, "All") for year in [2019, 2021, "All"] for area in ["North", "All"]]
+    selections += [("All", "Winter", "East", "January"), (2020, "Summer", "South", "June")]
+
+    checked = 0
+    for i_year, i_season, i_area, i_month in selections:
+        filtered_df = dashboard.filter_df(synthetic_data, i_year, i_season, i_area, i_month, None, None)
+        box_stats = dashboard.approx_box_stats(i_year, i_season, i_area, i_month, measure)
+        assert set(box_stats) == set(filtered_df["Source Type"])
+
+        for source_type, stats in box_stats.items():
+            values = filtered_df.loc[filtered_df["Source Type"] == source_type, measure]
+            approx = np.array([stats["q1"], stats["median"], stats["q3"]])
+            relative_error = np.abs(approx / exact_quartiles(values) - 1)
+            assert relative_error.max() <= dashboard.SKETCH_RELATIVE_ACCURACY
+            assert stats["min"] == values.min()
+            assert stats["max"] == values.max()
+            checked += 1
+    assert checked > 0
+
+
+def test_quartiles_of_tiny_samples():
+    for values in ([5.0], [1.0, 9.0], [1.0, 2.0, 3.0, 4.0]):
+        buckets = np.ceil(np.log(values) / np.log(dashboard.SKETCH_GAMMA)).astype(int)
+        bucket_counts = pd.Series(buckets).value_counts().sort_index()
+        approx = dashboard.sketch_quantiles(bucket_counts, [0.25, 0.5, 0.75])
+        exact = np.quantile(values, [0.25, 0.5, 0.75], method="hazen")
+        assert np.abs(approx / exact - 1).max() <= dashboard.SKETCH_RELATIVE_ACCURACY